@@ -1,19 +1,109 @@
-from random import sample, seed
-
-# seed('blackjack')
+import os
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
 
 RANKS = 'A23456789TJQK'
 SUITS = 'SDCH'
 CARDS = [r + s for s in SUITS for r in RANKS]
+OUTCOMES = 'win', 'push', 'loss', 'blackjack'
+PAYOUT = {'win': 1, 'push': 0, 'loss': -1, 'blackjack': 1.5}  # EV of an outcome, in bets
+HI_LO = [-1, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1]  # Hi-Lo count tag per rank
+
+
+class Shoe:
+    """
+     1-8 decks as one array of card indices (into CARDS), dealt through a cursor,
+     reshuffled between rounds once the cut card is reached (see new_round)
+
+    >>> shoe = Shoe(decks=6, penetration=0.75, rng=Random(0))
+    >>> len(shoe), shoe.cut
+    (312, 234)
+    >>> [next(shoe) for _ in range(4)], shoe.remaining[0], shoe.count
+    (['4S', '3C', '3C', '6C'], 24, 4)
+
+    >>> shoe = Shoe(decks=1, penetration=1, rng=Random(0))
+    >>> _ = [next(shoe) for _ in range(50)]
+    >>> shoe.new_round()
+    >>> table = [next(shoe) for _ in range(4)]  # the shoe runs out mid-round, the table stays out of the reshuffle
+    >>> table += [next(shoe) for _ in range(48)]
+    >>> len(set(table)), shoe.count  # every card once, the full deck counts 0
+    (52, 0)
+    """
+    __slots__ = ('cards', 'cursor', 'round_start', 'cut', 'rng', 'remaining', 'count')
+
+    def __init__(self, decks=6, penetration=0.75, rng=None):
+        assert 1 <= decks <= 8, 'shoe should hold 1 to 8 decks'
+        assert 0 <= penetration <= 1, 'penetration should be a fraction of the shoe'
+        self.cards = array('B', range(52)) * decks
+        self.cut = int(len(self.cards) * penetration)
+        self.rng = rng or Random()
+        self.remaining = [0] * 13  # cards left per rank (RANKS order)
+        self.cursor = self.round_start = 0  # cards dealt, cards dealt before this round
+        self.shuffle()
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """ deals the card at the cursor, reshuffles the cards off the table when the shoe runs out mid-round """
+        if self.cursor == len(self.cards): self.shuffle()
+        cards, cursor = self.cards, self.cursor
+        # Fisher-Yates one step at a time: only the dealt part of the shoe is ever shuffled
+        swap = cursor + int(self.rng.random() * (len(cards) - cursor))
+        card = cards[swap]
+        cards[swap], cards[cursor] = cards[cursor], card
+        self.cursor += 1
+        self.remaining[card % 13] -= 1
+        self.count += HI_LO[card % 13]
+        return CARDS[card]
+
+    def shuffle(self):
+        """
+         puts the cards of earlier rounds back, resets the composition and the running count to the cards of this
+         round, which stay on the table (the order is drawn while dealing)
+        """
+        cards, live = self.cards, self.cursor - self.round_start
+        for index in range(live):  # the live cards move to the front, as dealt
+            cards[index], cards[self.round_start + index] = cards[self.round_start + index], cards[index]
+        self.cursor, self.round_start = live, 0
+        self.remaining[:] = [len(cards) // 13] * 13
+        self.count = 0
+        for card in cards[:live]:
+            self.remaining[card % 13] -= 1
+            self.count += HI_LO[card % 13]
 
+    def new_round(self):
+        """ takes the cards of the last round off the table, reshuffles once past the cut card """
+        self.round_start = self.cursor
+        if self.needs_shuffle(): self.shuffle()
 
-def deck(shuffled=False):
-    cards = CARDS.copy()
-    return sample(cards, 52) if shuffled else cards
+    def needs_shuffle(self):
+        return self.cursor >= self.cut
+
+    def composition(self):
+        """ cards left per value: Ace, 2-9, Ten (T, J, Q and K) """
+        return (*self.remaining[:9], sum(self.remaining[9:]))
+
+
+def stand_on_17(player, upcard):
+    """ policy: hit below 17, like the dealer """
+    return Blackjack.calc_value(player) < 17
 
 
 class Blackjack:
-    def __init__(self):
+    def __init__(self, rng=None, shoe=None):
+        """
+         :param rng: RNG of the default shoe
+         :param shoe: a Shoe, defaults to a single deck reshuffled every round
+        """
+        self.shoe = shoe or Shoe(decks=1, penetration=0, rng=rng)
+        self.dealer, self.player = [], []
         self.reset()
 
     def __str__(self):
@@ -78,10 +168,11 @@ $$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$
             print('Dealer: XX %s\nPlayer: %s' % (' '.join(upcards), ' '.join(self.player)))
 
     def reset(self):
-        """ reset attributes """
+        """ reset attributes, reshuffles the shoe past its cut card """
         self.player_val = self.dealer_val = 0
-        self.dealer, self.player = [], []
-        self.cards = iter(deck(shuffled=True))
+        self.dealer.clear(), self.player.clear()
+        self.shoe.new_round()
+        self.cards = self.shoe
 
     def update_dealer(self):
         """ updates the dealer value """
@@ -91,6 +182,29 @@ $$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$
         """ updates the player value """
         self.player_val = self.calc_value(self.player)
 
+    def play_round(self, policy=stand_on_17):
+        """
+         plays a round without I/O, same rules as play:
+         :param policy: policy(player cards, dealer upcard) -> True to hit
+         :return: outcome, one of OUTCOMES
+        """
+        self.reset()
+        self.deal(), self.pull(), self.deal(), self.pull()
+        self.update_player(), self.update_dealer()
+        if self.dealer_val == 21:
+            return 'push' if self.player_val == 21 else 'loss'
+        if self.player_val == 21:
+            return 'blackjack'
+
+        while self.player_val < 21 and policy(self.player, self.dealer[1]):
+            self.deal(), self.update_player()
+        if self.player_val > 21:
+            return 'loss'
+        while 17 > self.dealer_val <= self.player_val: self.pull(), self.update_dealer()
+        return ('push' if self.player_val == self.dealer_val else
+                'loss' if self.player_val < self.dealer_val <= 21 else
+                'win')
+
     def play(self, assist=False):
         """
          simulates blackjack game:
@@ -134,4 +248,121 @@ $$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$
             if inp not in {'y', 'yes', 'r', 'retry', 'x'}: break
 
 
-Blackjack().play(assist=True)
+def simulate(rounds, policy=stand_on_17, seed=None, decks=1, penetration=0):
+    """
+     plays rounds headless
+     :param policy: a picklable policy (see Blackjack.play_round) to run in a process pool
+     :param seed: seed of the RNG stream
+     :param decks: decks in the shoe
+     :param penetration: fraction of the shoe dealt before reshuffling (0: every round)
+     :return: Counter of OUTCOMES
+
+    >>> simulate(1000, seed=0) == simulate(1000, seed=0)
+    True
+    >>> sum(simulate(1000, seed=0).values())
+    1000
+    """
+    game = Blackjack(shoe=Shoe(decks, penetration, rng=Random(seed)))
+    return Counter(game.play_round(policy) for _ in range(rounds))
+
+
+class RunningStats:
+    """
+     streaming statistics of rounds: Welford mean / variance of the EV per round (PAYOUT),
+     outcome frequencies and a normal confidence interval of the mean
+
+    >>> stats = RunningStats()
+    >>> for outcome in ('win', 'loss', 'loss', 'blackjack', 'push'):
+    ...     stats.add(outcome)
+    >>> stats.rounds, stats.mean, round(stats.variance(), 4), stats.frequency('loss')
+    (5, 0.1, 1.3, 0.4)
+    >>> other = RunningStats()
+    >>> other.add('win')
+    >>> stats.merge(other).rounds, round(stats.mean, 4), round(stats.variance(), 4)
+    (6, 0.25, 1.175)
+    """
+    __slots__ = ('rounds', 'mean', 'm2', 'outcomes')
+
+    def __init__(self):
+        self.rounds = 0
+        self.mean = self.m2 = 0.0
+        self.outcomes = Counter()
+
+    def add(self, outcome):
+        self.outcomes[outcome] += 1
+        self.rounds += 1
+        delta = PAYOUT[outcome] - self.mean
+        self.mean += delta / self.rounds
+        self.m2 += delta * (PAYOUT[outcome] - self.mean)
+
+    def merge(self, other):
+        """ combines the statistics of another (independent) run into this one """
+        rounds = self.rounds + other.rounds
+        if rounds:
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.rounds * other.rounds / rounds
+            self.mean += delta * other.rounds / rounds
+        self.rounds = rounds
+        self.outcomes.update(other.outcomes)
+        return self
+
+    def variance(self):
+        """ sample variance of the EV per round """
+        return self.m2 / (self.rounds - 1) if self.rounds > 1 else float('inf')
+
+    def half_width(self, z=1.96):
+        """ half width of the confidence interval of the mean (z = 1.96: 95%) """
+        return z * (self.variance() / self.rounds) ** .5 if self.rounds > 1 else float('inf')
+
+    def interval(self, z=1.96):
+        return self.mean - self.half_width(z), self.mean + self.half_width(z)
+
+    def frequency(self, outcome):
+        return self.outcomes[outcome] / self.rounds if self.rounds else 0.0
+
+    def snapshot(self, z=1.96):
+        return {'rounds': self.rounds, 'ev': self.mean, 'interval': self.interval(z),
+                'frequencies': {outcome: self.frequency(outcome) for outcome in OUTCOMES}}
+
+
+def simulate_until(half_width=0.01, policy=stand_on_17, seed=None, decks=1, penetration=0, z=1.96,
+                   min_rounds=1_000, max_rounds=10 ** 8, report_every=100_000, progress=None):
+    """
+     plays rounds until the confidence interval of the EV per round is narrower than half_width
+     :param progress: progress(snapshot) called every report_every rounds (see RunningStats.snapshot)
+     :return: RunningStats, also of the rounds played so far when interrupted (KeyboardInterrupt)
+
+    >>> stats = simulate_until(half_width=0.05, seed=0)
+    >>> stats.half_width() < 0.05, 1_000 <= stats.rounds < 5_000
+    (True, True)
+    """
+    game = Blackjack(shoe=Shoe(decks, penetration, rng=Random(seed)))
+    stats, started = RunningStats(), time.perf_counter()
+    try:
+        while stats.rounds < max_rounds:
+            for _ in range(min(1_000, max_rounds - stats.rounds)):  # check convergence every 1000 rounds
+                stats.add(game.play_round(policy))
+                if progress and stats.rounds % report_every == 0:
+                    progress({**stats.snapshot(z), 'seconds': time.perf_counter() - started})
+            if stats.rounds >= min_rounds and stats.half_width(z) < half_width:
+                break
+    except KeyboardInterrupt:
+        pass
+    return stats
+
+
+def simulate_parallel(rounds, policy=stand_on_17, workers=None, seed=0, decks=1, penetration=0):
+    """
+     shards rounds over a process pool, each shard with an independent RNG stream seeded by (seed, shard)
+     :return: Counter of OUTCOMES, merged over all shards
+    """
+    workers = workers or os.cpu_count() or 1
+    shares = [rounds // workers + (shard < rounds % workers) for shard in range(workers)]
+    seeds = [f'{seed}/{shard}' for shard in range(workers)]
+    with ProcessPoolExecutor(workers) as executor:
+        return sum(executor.map(simulate, shares, [policy] * workers, seeds, [decks] * workers,
+                                [penetration] * workers), Counter())
+
+
+if __name__ == '__main__':
+    Blackjack().play(assist=True)
@@ -0,0 +1,225 @@
+"""
+Blackjack: exact composition-dependent EVs and strategy tables
+
+The rules are those of Blackjack.play: the dealer peeks for Blackjack, then draws while below 17 and not above
+the player (so stands on soft 17), a Blackjack pays 3:2. Doubling takes exactly one more card at twice the stake.
+Compositions are the cards left per value (Ace, 2-9, Ten), as given by Shoe.composition().
+
+    python blackjack_strategy.py [DECKS]
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, lru_cache
+from math import prod
+
+VALUES = 'A23456789T'
+VALUE_INDEX = {**{value: index for index, value in enumerate(VALUES)}, 'J': 9, 'Q': 9, 'K': 9}
+BUST = 22  # index of a bust in a dealer distribution
+ACTIONS = 'stand', 'hit', 'double'
+
+
+def full_shoe(decks=8):
+    return (4 * decks,) * 9 + (16 * decks,)
+
+
+def remove(composition, index):
+    return composition[:index] + (composition[index] - 1,) + composition[index + 1:]
+
+
+def add_card(total, soft, index):
+    """
+     adds a card to a (total, soft) hand, counting an Ace as 11 while it does not bust (as Blackjack.calc_value)
+
+    >>> from blackjack import Blackjack
+
+    >>> hand = (0, False)
+    >>> for card in 'A5A9':
+    ...     hand = add_card(*hand, VALUE_INDEX[card])
+    >>> hand, Blackjack.calc_value(['A', '5', 'A', '9'])
+    ((16, False), 16)
+    """
+    total += index + 1
+    if index == 0 and total <= 11:
+        total += 10; soft = True
+    if total > 21 and soft:
+        total -= 10; soft = False
+    return total, soft
+
+
+@cache
+def dealer_patterns(upcard, cap):
+    """
+     the dealer's draws as a composition independent DAG of drawn cards, the dealer stops at 17 or above cap
+     (the player's total), a Blackjack (peeked) is left out. Per hand the dealer still draws to:
+     (drawn cards as flat indices value * 13 + count, number of cards, number of orderings,
+      the draws ending the hand as (value, count of that value drawn, final total or BUST))
+    """
+    layer, patterns = {(0,) * 10: [1, *add_card(0, False, upcard)]}, []
+    while layer:
+        following = {}
+        for drawn, (ways, total, soft) in layer.items():
+            ends = []
+            for index in range(10):
+                card_total, card_soft = add_card(total, soft, index)
+                if card_total == 21 and not any(drawn):
+                    continue
+                if card_total >= 17 or card_total > cap:
+                    ends.append((index, drawn[index], min(card_total, BUST)))
+                else:
+                    cards = drawn[:index] + (drawn[index] + 1,) + drawn[index + 1:]
+                    following.setdefault(cards, [0, card_total, card_soft])[0] += ways
+            patterns.append((tuple(index * 13 + count for index, count in enumerate(drawn) if count),
+                             sum(drawn), ways, tuple(ends)))
+        layer = following
+    return tuple(patterns)
+
+
+@lru_cache(maxsize=1 << 15)
+def dealer_distribution(composition, upcard, cap=16):
+    """
+     probabilities of the dealer's final totals (index 17-21, or below 17 when above the player) and of a bust
+     (index BUST), given the dealer does not have Blackjack: a weighted sum over dealer_patterns
+     :param composition: cards left, after removing the dealer's upcard and the player's cards
+     :param cap: the player's total, the dealer stops once above it (only matters below 17)
+
+    >>> distribution = dealer_distribution(remove(full_shoe(1), 5), 5)
+    >>> round(sum(distribution), 12), round(distribution[BUST], 4)
+    (1.0, 0.4208)
+    """
+    size = sum(composition)
+    falling = []  # falling[index * 13 + count]: orderings of count cards of a value, out of those left
+    for left in composition:
+        orderings = 1
+        for count in range(13):
+            falling.append(orderings)
+            orderings *= left - count
+    denominators = [1]
+    for count in range(21):
+        denominators.append(denominators[-1] * (size - count))
+
+    distribution = [0.0] * (BUST + 1)
+    get = falling.__getitem__
+    for cards, count, ways, ends in dealer_patterns(upcard, min(cap, 16)):
+        probability = prod(map(get, cards), start=ways) / (denominators[count] * (size - count))
+        for index, drawn, final in ends:
+            distribution[final] += probability * (composition[index] - drawn)
+    if upcard in (0, 9):  # condition on the hole card not completing a Blackjack
+        no_blackjack = 1 - composition[9 - upcard] / size
+        distribution = [probability / no_blackjack for probability in distribution]
+    return tuple(distribution)
+
+
+def stand_ev(composition, total, upcard):
+    distribution = dealer_distribution(composition, upcard, total)
+    return distribution[BUST] + sum(distribution[:total]) - sum(distribution[total + 1:BUST])
+
+
+@lru_cache(maxsize=1 << 18)
+def player_ev(composition, total, soft, upcard):
+    """ EV of a (total, soft) hand playing on optimally (stand or hit), memoized on the composition left """
+    stand = stand_ev(composition, total, upcard)
+    if total >= 21:
+        return stand
+    size, hit = sum(composition), 0.0
+    for index, left in enumerate(composition):
+        if left:
+            card_total, card_soft = add_card(total, soft, index)
+            hit += left / size * (player_ev(remove(composition, index), card_total, card_soft, upcard)
+                                  if card_total <= 21 else -1.0)
+    return max(stand, hit)
+
+
+def hand_evs(composition, cards, upcard):
+    """
+     EVs of standing, hitting (then playing optimally) and doubling on a two card hand
+     :param composition: cards left before dealing cards and upcard
+     :param cards: the player's two cards, e.g. ['T', '6'] or ['KD', '6S']
+     :param upcard: the dealer's upcard, e.g. '6'
+
+    >>> {action: round(ev, 4) for action, ev in hand_evs(full_shoe(8), ['T', '6'], '6').items()}
+    {'stand': -0.1565, 'hit': -0.4268, 'double': -0.8536}
+    """
+    upcard = VALUE_INDEX[upcard[0]]
+    composition = remove(composition, upcard)
+    hand = 0, False
+    for card in cards:
+        index = VALUE_INDEX[card[0]]
+        composition, hand = remove(composition, index), add_card(*hand, index)
+    total, soft = hand
+
+    size, hit, double = sum(composition), 0.0, 0.0
+    for index, left in enumerate(composition):
+        if left:
+            card_total, card_soft = add_card(total, soft, index)
+            following = remove(composition, index)
+            if card_total > 21:
+                hit -= left / size
+                double -= 2 * left / size
+            else:
+                hit += left / size * player_ev(following, card_total, card_soft, upcard)
+                double += 2 * left / size * stand_ev(following, card_total, upcard)
+    return dict(zip(ACTIONS, (stand_ev(composition, total, upcard), hit, double)))
+
+
+def two_card_hands():
+    """ rows of a strategy table (hard 4-20, soft 12-20) with the two card hands making them """
+    rows = {}
+    for first in range(10):
+        for second in range(first, 10):
+            total, soft = add_card(*add_card(0, False, first), second)
+            if total < 21:
+                rows.setdefault(('soft ' if soft else 'hard ') + str(total), []).append((VALUES[first], VALUES[second]))
+    return dict(sorted(rows.items(), key=lambda row: (row[0][0] == 's', int(row[0][5:]))))
+
+
+def strategy_column(composition, upcard):
+    """
+     best action and its EV per row against an upcard,
+     the EVs of a row are averaged over its two card hands, weighted by their probability
+    """
+    left = remove(composition, VALUE_INDEX[upcard])
+    column = {}
+    for row, hands in two_card_hands().items():
+        evs, weights = dict.fromkeys(ACTIONS, 0.0), 0
+        for first, second in hands:
+            first_left = left[VALUE_INDEX[first]]
+            weight = first_left * (left[VALUE_INDEX[second]] - (first == second)) * (1 + (first != second))
+            if weight:
+                weights += weight
+                for action, ev in hand_evs(composition, [first, second], upcard).items():
+                    evs[action] += weight * ev
+        action = max(ACTIONS, key=evs.get)
+        column[row] = action, evs[action] / weights
+    return column
+
+
+def strategy_table(composition=full_shoe(8), workers=None):
+    """
+     basic strategy: best action and EV per row (see two_card_hands) and upcard (VALUES), one process per upcard
+     :return: {row: {upcard: (action, ev)}}
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        columns = [strategy_column(composition, upcard) for upcard in VALUES]
+    else:
+        with ProcessPoolExecutor(min(workers, len(VALUES))) as executor:
+            columns = list(executor.map(strategy_column, [composition] * len(VALUES), VALUES))
+    return {row: {upcard: column[row] for upcard, column in zip(VALUES, columns)} for row in columns[0]}
+
+
+def format_table(table):
+    """ S: stand, H: hit, D: double """
+    lines = ['         ' + '  '.join(VALUES)]
+    for row, actions in table.items():
+        lines.append(f'{row:<8} ' + '  '.join(action[0].upper() for action, _ in actions.values()))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    start = time.perf_counter()
+    decks = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    print(format_table(strategy_table(full_shoe(decks))))
+    print(f'\n{decks} deck(s), {time.perf_counter() - start:.1f}s')
@@ -1,63 +1,641 @@
 """
 Chess
+
+Squares are numbered 0 (a1) to 63 (h8) rank by rank, a piece is 2 * type + colour (GRAPHICAL_PIECE order).
+The board keeps a 64-bit integer bitboard per piece and per colour next to the square list; knight, king and pawn
+attacks are precomputed per square, sliding attacks are looked up per line (rank, file and both diagonals) by the
+occupancy of that line.
+
+    python chess.py perft [DEPTH] [--fen FEN] [--hash BITS]  (nodes and nodes/sec, checked against PERFT_SUITE)
 """
+from array import array
+from random import Random
+
 GRAPHICAL_PIECE = 'PpNnBbRrQqKk-'
 NAME_PIECE = ['white pawn', 'black pawn', 'white knight', 'black knight', 'white bishop', 'black bishop',
               'white rook', 'black rook', 'white queen', 'black queen', 'white king', 'black king', 'none']
 
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+EMPTY = -1
+NORMAL, DOUBLE_PUSH, EN_PASSANT, CASTLE = range(4)  # move flags
+FILES, RANKS = 'abcdefgh', '12345678'
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# reference node counts per depth (https://www.chessprogramming.org/Perft_Results)
+PERFT_SUITE = {
+    START_FEN: (20, 400, 8902, 197281, 4865609),
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1': (48, 2039, 97862, 4085603),
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1': (14, 191, 2812, 43238, 674624),
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1': (6, 264, 9467, 422333),
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8': (44, 1486, 62379, 2103487),
+}
+
+
+def on_board(square, rank_step, file_step):
+    rank, file = square // 8 + rank_step, square % 8 + file_step
+    return rank * 8 + file if 0 <= rank < 8 and 0 <= file < 8 else None
+
+
+def step_attacks(steps):
+    return tuple(sum(1 << target for rank, file in steps if (target := on_board(square, rank, file)) is not None)
+                 for square in range(64))
+
+
+KNIGHT_ATTACKS = step_attacks(((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)))
+KING_ATTACKS = step_attacks(((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)))
+PAWN_ATTACKS = step_attacks(((1, -1), (1, 1))), step_attacks(((-1, -1), (-1, 1)))  # per colour
+
+
+def ray(square, rank_step, file_step):
+    squares = []
+    while (square := on_board(square, rank_step, file_step)) is not None:
+        squares.append(square)
+    return squares
+
+
+def line_table(square, rank_step, file_step):
+    """
+    (mask, {occupancy & mask: attacks}) along a line through square, both ways: the mask leaves out the ends
+    of the line, whose occupancy never changes the attacks
+    """
+    rays = ray(square, rank_step, file_step), ray(square, -rank_step, -file_step)
+    mask = sum(1 << target for squares in rays for target in squares[:-1])
+    table, occupancy = {}, 0
+    while True:  # every subset of mask (carry-rippler)
+        attacks = 0
+        for squares in rays:
+            for target in squares:
+                attacks |= 1 << target
+                if occupancy >> target & 1:
+                    break
+        table[occupancy] = attacks
+        if not (occupancy := (occupancy - mask) & mask):
+            return mask, table
+
+
+ROOK_LINES = tuple((line_table(square, 0, 1), line_table(square, 1, 0)) for square in range(64))
+BISHOP_LINES = tuple((line_table(square, 1, 1), line_table(square, 1, -1)) for square in range(64))
+
+
+def rook_attacks(square, occupied):
+    (rank_mask, rank), (file_mask, file) = ROOK_LINES[square]
+    return rank[occupied & rank_mask] | file[occupied & file_mask]
 
-# double move
-# en-peasant
-# castling
+
+def bishop_attacks(square, occupied):
+    (diagonal_mask, diagonal), (anti_mask, anti) = BISHOP_LINES[square]
+    return diagonal[occupied & diagonal_mask] | anti[occupied & anti_mask]
+
+
+# castling rights: white king side, white queen side, black king side, black queen side
+CASTLING_RIGHTS = 'KQkq'
+CASTLING_KEEP = [15] * 64  # rights kept after a move from or to a square
+for _square, _lost in ((4, 3), (7, 1), (0, 2), (60, 12), (63, 4), (56, 8)):
+    CASTLING_KEEP[_square] = 15 ^ _lost
+# king from, king to, rook from, rook to, right, squares to be empty, squares not to be attacked
+CASTLES = ((4, 6, 7, 5, 1, 0x60, (4, 5, 6)), (4, 2, 0, 3, 2, 0xe, (4, 3, 2)),
+           (60, 62, 63, 61, 4, 0x60 << 56, (60, 61, 62)), (60, 58, 56, 59, 8, 0xe << 56, (60, 59, 58)))
+
+
+_random = Random(2024)
+ZOBRIST_PIECE = tuple(tuple(_random.getrandbits(64) for _ in range(64)) for _ in range(12))
+ZOBRIST_CASTLING = tuple(_random.getrandbits(64) for _ in range(16))
+ZOBRIST_EN_PASSANT = tuple(_random.getrandbits(64) for _ in range(8))  # per file
+ZOBRIST_SIDE = _random.getrandbits(64)  # black to move
+
+
+def encode_move(start, target, promotion=0, flag=NORMAL):
+    """ start | target << 6 | promotion piece type << 12 | flag << 16 """
+    return start | target << 6 | promotion << 12 | flag << 16
+
+
+def move_name(move):
+    """
+    long algebraic (UCI) notation
+
+    >>> move_name(encode_move(12, 28, flag=DOUBLE_PUSH)), move_name(encode_move(52, 60, QUEEN))
+    ('e2e4', 'e7e8q')
+    """
+    start, target, promotion = move & 63, move >> 6 & 63, move >> 12 & 7
+    return (FILES[start % 8] + RANKS[start // 8] + FILES[target % 8] + RANKS[target // 8]
+            + ('nbrq'[promotion - 1] if promotion else ''))
 
 
 class Board:
+    """
+    >>> board = Board()
+    >>> print(board)
+    r n b q k b n r
+    p p p p p p p p
+    - - - - - - - -
+    - - - - - - - -
+    - - - - - - - -
+    - - - - - - - -
+    P P P P P P P P
+    R N B Q K B N R
+    >>> len(board.legal_moves()), board.perft(3)
+    (20, 8902)
+    >>> board.set_fen('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+    >>> board.perft(2)  # castling, en passant, promotions and pins
+    2039
+    >>> [Board(fen).perft(3) for fen in list(PERFT_SUITE)[2:]]
+    [2812, 9467, 62379]
+
+    >>> from random import Random
+    >>> rng, board = Random(0), Board(list(PERFT_SUITE)[1])
+    >>> for _ in range(60):  # captures, castling, en passant and promotions keep the Zobrist key up to date
+    ...     board.make_move(rng.choice(board.legal_moves()))
+    ...     assert board.key == board.compute_key()
+    >>> while board.history:
+    ...     _ = board.unmake_move()
+    >>> board.key == Board(list(PERFT_SUITE)[1]).key
+    True
+
+    >>> board = Board()
+    >>> for name in ['g1f3', 'g8f6', 'f3g1', 'f6g8'] * 2:
+    ...     board.make_move(board.find_move(name))
+    >>> board.repetitions()  # the start position, for the third time
+    2
+    """
     OFFSETS = [8, -8,  # up-down
                1, -1,  # left-right
                7, -7,  # diagonal 1
                9, -9]  # diagonal 2
 
-    def __init__(self) -> None:
+    def __init__(self, fen: str = START_FEN) -> None:
         self.square: list[int] = []
-        self.has_moved: list[int] = []
-
+        self.pieces: list[int] = []  # bitboard per piece
+        self.colours: list[int] = []  # bitboard per colour
         self.is_white = True
-        self.reset()
+        self.castling = 0
+        self.en_passant = EMPTY  # square a pawn can capture on, or EMPTY
+        self.halfmove = 0
+        self.fullmove = 1
+        self.history = []  # undo stack
+        self.key = 0  # Zobrist key, kept up to date by make_move
+        self.keys = []  # keys of the positions before each move of history
+        self.set_fen(fen)
+
+    @property
+    def white_occupied(self) -> int:
+        return self.colours[WHITE]
 
-        self.white_occupied = set()
-        self.black_occupied = set()
+    @property
+    def black_occupied(self) -> int:
+        return self.colours[BLACK]
 
-    def occupied(self):
-        return self.white_occupied | self.black_occupied
+    def occupied(self) -> int:
+        return self.colours[WHITE] | self.colours[BLACK]
 
     def is_occupied(self, i: int) -> bool:
-        return i in self.occupied()
+        return bool(self.occupied() >> i & 1)
 
     def reset(self) -> None:
-        self.has_moved = [0] * 64
-        self.square = [
-            6, 2, 4, 8, 10, 4, 2, 6,
-            0, 0, 0, 0, 0, 0, 0, 0,
-            -1, -1, -1, -1, -1, -1, -1, -1,
-            -1, -1, -1, -1, -1, -1, -1, -1,
-            -1, -1, -1, -1, -1, -1, -1, -1,
-            -1, -1, -1, -1, -1, -1, -1, -1,
-            1, 1, 1, 1, 1, 1, 1, 1,
-            7, 3, 5, 9, 11, 5, 3, 7,
-        ]
-        self.white_occupied = {0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15}
-        self.black_occupied = {48, 49, 50, 51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63}
+        self.set_fen(START_FEN)
+
+    def set_fen(self, fen: str) -> None:
+        """
+        the position of a FEN record
+
+        >>> Board('4k3/8/8/8/8/8/8/N3K2R w KQ e6 0 1').fen()  # no rook on a1, no pawn on e5
+        '4k3/8/8/8/8/8/8/N3K2R w K - 0 1'
+        """
+        placement, side, castling, en_passant, *clocks = fen.split()
+        self.square, self.pieces, self.colours = [EMPTY] * 64, [0] * 12, [0, 0]
+        rows = placement.split('/')
+        assert len(rows) == 8, f'invalid FEN placement {placement!r}'
+        for rank, row in zip(range(7, -1, -1), rows):
+            file = 0
+            for char in row:
+                if char.isdigit():
+                    file += int(char)
+                else:
+                    assert file < 8 and char in GRAPHICAL_PIECE[:12], f'invalid FEN placement {placement!r}'
+                    self.put(GRAPHICAL_PIECE.index(char), rank * 8 + file)
+                    file += 1
+            assert file == 8, f'invalid FEN placement {placement!r}'
+        self.is_white = side == 'w'
+        # a right without its rook, or an en passant square without the pawn that passed it, is dropped
+        self.castling = sum(right for index, (_, _, rook, _, right, _, _) in enumerate(CASTLES)
+                            if CASTLING_RIGHTS[index] in castling and self.square[rook] == ROOK * 2 + index // 2)
+        self.en_passant = EMPTY if en_passant == '-' else FILES.index(en_passant[0]) + 8 * RANKS.index(en_passant[1])
+        if self.en_passant != EMPTY and self.square[self.en_passant - 8 if self.is_white else self.en_passant + 8] \
+                != PAWN * 2 + (BLACK if self.is_white else WHITE):
+            self.en_passant = EMPTY
+        self.halfmove, self.fullmove = map(int, clocks) if clocks else (0, 1)
+        self.history, self.keys = [], []
+        self.key = self.compute_key()
+
+    def fen(self) -> str:
+        """
+        the FEN record of the position
+
+        >>> board = Board()
+        >>> board.make_move(board.find_move('e2e4'))
+        >>> board.fen()
+        'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'
+        >>> all(Board(fen).fen() == fen for fen in PERFT_SUITE)
+        True
+        """
+        rows = []
+        for rank in range(7, -1, -1):
+            row, empty = '', 0
+            for piece in self.square[rank * 8:rank * 8 + 8]:
+                if piece == EMPTY:
+                    empty += 1
+                else:
+                    row += (str(empty) if empty else '') + GRAPHICAL_PIECE[piece]
+                    empty = 0
+            rows.append(row + (str(empty) if empty else ''))
+        castling = ''.join(right for index, right in enumerate(CASTLING_RIGHTS) if self.castling >> index & 1)
+        en_passant = '-' if self.en_passant == EMPTY else FILES[self.en_passant % 8] + RANKS[self.en_passant // 8]
+        return (f'{"/".join(rows)} {"w" if self.is_white else "b"} {castling or "-"} {en_passant} '
+                f'{self.halfmove} {self.fullmove}')
+
+    def compute_key(self) -> int:
+        """ Zobrist key of the position from scratch (make_move updates it incrementally) """
+        key = 0 if self.is_white else ZOBRIST_SIDE
+        for square, piece in enumerate(self.square):
+            if piece != EMPTY:
+                key ^= ZOBRIST_PIECE[piece][square]
+        key ^= ZOBRIST_CASTLING[self.castling]
+        if self.en_passant != EMPTY:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant % 8]
+        return key
+
+    def repetitions(self) -> int:
+        """ earlier occurrences of the position, back to the last capture or pawn move """
+        keys, key = self.keys, self.key
+        return sum(keys[index] == key for index in range(len(keys) - 2, max(-1, len(keys) - 1 - self.halfmove), -2))
+
+    def is_draw(self) -> bool:
+        """ by threefold repetition or the fifty-move rule """
+        return self.halfmove >= 100 or self.repetitions() >= 2
+
+    def put(self, piece: int, square: int) -> None:
+        self.square[square] = piece
+        self.pieces[piece] |= 1 << square
+        self.colours[piece & 1] |= 1 << square
 
     def __str__(self) -> str:
         view = reversed if self.is_white else iter  # mirror horizontally
         return '\n'.join(' '.join(GRAPHICAL_PIECE[self.square[8 * rank + file]]
                                   for file in range(8)) for rank in view(range(8)))
 
+    def is_attacked(self, square: int, by: int) -> bool:
+        """ whether colour by attacks square """
+        pieces, occupied = self.pieces, self.colours[WHITE] | self.colours[BLACK]
+        return bool(PAWN_ATTACKS[by ^ 1][square] & pieces[PAWN * 2 + by]
+                    or KNIGHT_ATTACKS[square] & pieces[KNIGHT * 2 + by]
+                    or KING_ATTACKS[square] & pieces[KING * 2 + by]
+                    or rook_attacks(square, occupied) & (pieces[ROOK * 2 + by] | pieces[QUEEN * 2 + by])
+                    or bishop_attacks(square, occupied) & (pieces[BISHOP * 2 + by] | pieces[QUEEN * 2 + by]))
 
-game = Board()
-print(game)
+    def in_check(self) -> bool:
+        colour = BLACK if not self.is_white else WHITE
+        return self.is_attacked(self.pieces[KING * 2 + colour].bit_length() - 1, colour ^ 1)
 
-if __name__ == '__main__':
-    import doctest
+    def pseudo_legal_moves(self) -> list[int]:
+        """ moves by the rules of movement, possibly leaving the own king in check """
+        colour = WHITE if self.is_white else BLACK
+        pieces, own, enemy = self.pieces, self.colours[colour], self.colours[colour ^ 1]
+        occupied = own | enemy
+        moves = []
+        append = moves.append
+
+        # pawns
+        forward, start_rank, last_rank = (8, 1, 7) if colour == WHITE else (-8, 6, 0)
+        attacks = PAWN_ATTACKS[colour]
+        targets = enemy | (1 << self.en_passant if self.en_passant != EMPTY else 0)
+        bits = pieces[PAWN * 2 + colour]
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            start = low.bit_length() - 1
+            pushes = []
+            target = start + forward
+            if not occupied >> target & 1:
+                pushes.append(target)
+                if start // 8 == start_rank and not occupied >> (target + forward) & 1:
+                    append(encode_move(start, target + forward, 0, DOUBLE_PUSH))
+            captures = attacks[start] & targets
+            while captures:
+                low = captures & -captures
+                captures ^= low
+                pushes.append(low.bit_length() - 1)
+            for target in pushes:
+                if target // 8 == last_rank:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        append(encode_move(start, target, promotion))
+                else:
+                    append(encode_move(start, target, 0, EN_PASSANT if target == self.en_passant else NORMAL))
+
+        # pieces
+        for kind in KNIGHT, BISHOP, ROOK, QUEEN, KING:
+            bits = pieces[kind * 2 + colour]
+            while bits:
+                low = bits & -bits
+                bits ^= low
+                start = low.bit_length() - 1
+                if kind == KNIGHT:
+                    targets = KNIGHT_ATTACKS[start]
+                elif kind == BISHOP:
+                    targets = bishop_attacks(start, occupied)
+                elif kind == ROOK:
+                    targets = rook_attacks(start, occupied)
+                elif kind == QUEEN:
+                    targets = rook_attacks(start, occupied) | bishop_attacks(start, occupied)
+                else:
+                    targets = KING_ATTACKS[start]
+                targets &= ~own
+                while targets:
+                    low = targets & -targets
+                    targets ^= low
+                    append(start | (low.bit_length() - 1) << 6)
+
+        # castling, through squares not attacked
+        for king, target, _, _, right, between, safe in CASTLES[2 * colour:2 * colour + 2]:
+            if self.castling & right and not occupied & between and \
+                    not any(self.is_attacked(square, colour ^ 1) for square in safe):
+                append(encode_move(king, target, 0, CASTLE))
+        return moves
+
+    def legal_moves(self) -> list[int]:
+        """ pseudo-legal moves not leaving the own king in check """
+        legal = []
+        colour = WHITE if self.is_white else BLACK
+        for move in self.pseudo_legal_moves():
+            self.make_move(move)
+            if not self.is_attacked(self.pieces[KING * 2 + colour].bit_length() - 1, colour ^ 1):
+                legal.append(move)
+            self.unmake_move()
+        return legal
+
+    def make_move(self, move: int) -> None:
+        """ plays a (pseudo-legal) move in place, unmake_move takes it back """
+        start, target, promotion, flag = move & 63, move >> 6 & 63, move >> 12 & 7, move >> 16
+        square, pieces, colours = self.square, self.pieces, self.colours
+        piece = square[start]
+        colour = piece & 1
+        captured_square = target if flag != EN_PASSANT else target - 8 if colour == WHITE else target + 8
+        captured = square[captured_square]
+        self.history.append((move, captured, self.castling, self.en_passant, self.halfmove))
+        self.keys.append(key := self.key)
+
+        if captured != EMPTY:
+            square[captured_square] = EMPTY
+            pieces[captured] ^= 1 << captured_square
+            colours[colour ^ 1] ^= 1 << captured_square
+            key ^= ZOBRIST_PIECE[captured][captured_square]
+        moved = 1 << start | 1 << target
+        square[start], square[target] = EMPTY, piece
+        pieces[piece] ^= moved
+        colours[colour] ^= moved
+        key ^= ZOBRIST_PIECE[piece][start]
+        if promotion:
+            square[target] = promotion * 2 + colour
+            pieces[piece] ^= 1 << target
+            pieces[promotion * 2 + colour] |= 1 << target
+            key ^= ZOBRIST_PIECE[promotion * 2 + colour][target]
+        else:
+            key ^= ZOBRIST_PIECE[piece][target]
+            if flag == CASTLE:
+                _, _, rook_start, rook_target, *_ = CASTLES[2 * colour + (target < start)]
+                rook = ROOK * 2 + colour
+                square[rook_start], square[rook_target] = EMPTY, rook
+                pieces[rook] ^= 1 << rook_start | 1 << rook_target
+                colours[colour] ^= 1 << rook_start | 1 << rook_target
+                key ^= ZOBRIST_PIECE[rook][rook_start] ^ ZOBRIST_PIECE[rook][rook_target]
+
+        if self.en_passant != EMPTY:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant % 8]
+        key ^= ZOBRIST_CASTLING[self.castling]
+        self.castling &= CASTLING_KEEP[start] & CASTLING_KEEP[target]
+        key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_SIDE
+        self.en_passant = (start + target) // 2 if flag == DOUBLE_PUSH else EMPTY
+        if self.en_passant != EMPTY:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant % 8]
+        self.key = key
+        self.halfmove = 0 if captured != EMPTY or piece >> 1 == PAWN else self.halfmove + 1
+        self.fullmove += colour
+        self.is_white = not self.is_white
+
+    def unmake_move(self) -> int:
+        """ takes back the last move, returns it """
+        move, captured, self.castling, self.en_passant, self.halfmove = self.history.pop()
+        self.key = self.keys.pop()
+        start, target, promotion, flag = move & 63, move >> 6 & 63, move >> 12 & 7, move >> 16
+        square, pieces, colours = self.square, self.pieces, self.colours
+        self.is_white = not self.is_white
+        colour = WHITE if self.is_white else BLACK
+        self.fullmove -= colour
+        piece = PAWN * 2 + colour if promotion else square[target]
+
+        if promotion:
+            pieces[promotion * 2 + colour] ^= 1 << target
+            pieces[piece] ^= 1 << target
+        elif flag == CASTLE:
+            _, _, rook_start, rook_target, *_ = CASTLES[2 * colour + (target < start)]
+            rook = ROOK * 2 + colour
+            square[rook_start], square[rook_target] = rook, EMPTY
+            pieces[rook] ^= 1 << rook_start | 1 << rook_target
+            colours[colour] ^= 1 << rook_start | 1 << rook_target
+        moved = 1 << start | 1 << target
+        square[start], square[target] = piece, EMPTY
+        pieces[piece] ^= moved
+        colours[colour] ^= moved
+        if captured != EMPTY:
+            captured_square = target if flag != EN_PASSANT else target - 8 if colour == WHITE else target + 8
+            square[captured_square] = captured
+            pieces[captured] ^= 1 << captured_square
+            colours[colour ^ 1] ^= 1 << captured_square
+        return move
+
+    def make_null_move(self) -> None:
+        """ passes the move (for null-move pruning), unmake_null_move takes it back """
+        self.history.append((0, EMPTY, self.castling, self.en_passant, self.halfmove))
+        self.keys.append(self.key)
+        if self.en_passant != EMPTY:
+            self.key ^= ZOBRIST_EN_PASSANT[self.en_passant % 8]
+            self.en_passant = EMPTY
+        self.key ^= ZOBRIST_SIDE
+        self.halfmove += 1
+        self.is_white = not self.is_white
+
+    def unmake_null_move(self) -> None:
+        _, _, self.castling, self.en_passant, self.halfmove = self.history.pop()
+        self.key = self.keys.pop()
+        self.is_white = not self.is_white
+
+    def find_move(self, name: str) -> int:
+        """ the legal move in long algebraic (UCI) notation, e.g. 'e2e4' or 'e7e8q' """
+        for move in self.legal_moves():
+            if move_name(move) == name:
+                return move
+        raise ValueError(f'illegal move {name!r}')
+
+    def parse_san(self, san: str) -> int:
+        """
+        the legal move in standard algebraic notation (as in PGN), only candidates are checked for legality
 
-    doctest.testmod()
+        >>> board = Board('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+        >>> [move_name(board.parse_san(san)) for san in ('O-O-O', 'Nxf7', 'Qxh3', 'dxe6', 'Nb1', 'Bxa6+')]
+        ['e1c1', 'e5f7', 'f3h3', 'd5e6', 'c3b1', 'e2a6']
+        >>> board = Board('k7/8/8/8/8/8/8/R4RK1 w - - 0 1')
+        >>> move_name(board.parse_san('Rac1'))
+        'a1c1'
+        >>> board.parse_san('Rc1')  # both rooks can
+        Traceback (most recent call last):
+        ...
+        ValueError: ambiguous move 'Rc1'
+        """
+        text = san.rstrip('+#!?')
+        colour = WHITE if self.is_white else BLACK
+        if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            king, target = CASTLES[2 * colour + (len(text) > 3)][:2]
+            candidates = [move for move in self.pseudo_legal_moves() if move == encode_move(king, target, 0, CASTLE)]
+        else:
+            promotion = 0
+            if text[-1] in 'NBRQ' and text[-2:-1] in ('=', '1', '8'):
+                promotion = 'PNBRQ'.index(text[-1])
+                text = text[:-1].rstrip('=')
+            kind = 'PNBRQK'.index(text[0]) if text[0] in 'NBRQK' else PAWN
+            text = text[1:] if kind != PAWN else text
+            if len(text) < 2 or text[-2] not in FILES or text[-1] not in RANKS:
+                raise ValueError(f'invalid move {san!r}')
+            target = FILES.index(text[-2]) + 8 * RANKS.index(text[-1])
+            origin = text[:-2].rstrip('x')  # disambiguation: file, rank or square
+            square = self.square
+            candidates = [move for move in self.pseudo_legal_moves()
+                          if move >> 6 & 63 == target and square[move & 63] == kind * 2 + colour
+                          and move >> 12 & 7 == promotion
+                          and all(char == (FILES[(move & 63) % 8] if char in FILES else RANKS[(move & 63) // 8])
+                                  for char in origin)]
+        legal = []
+        for move in candidates:
+            self.make_move(move)
+            if not self.is_attacked(self.pieces[KING * 2 + colour].bit_length() - 1, colour ^ 1):
+                legal.append(move)
+            self.unmake_move()
+        if len(legal) != 1:
+            raise ValueError(f'{"ambiguous" if legal else "illegal"} move {san!r}')
+        return legal[0]
+
+    def perft(self, depth: int, table: 'TranspositionTable | None' = None) -> int:
+        """
+        leaf nodes of the legal move tree, depth plies deep, counts of subtrees are cached in table if given
+
+        >>> Board().perft(4, TranspositionTable(16))
+        197281
+        """
+        if depth == 0:
+            return 1
+        if table and depth > 1 and (entry := table.probe(self.key)) and entry[0] == depth:
+            return entry[1]
+        moves = self.legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1, table)
+            self.unmake_move()
+        if table:
+            table.store(self.key, depth, nodes, TranspositionTable.EXACT, 0)
+        return nodes
+
+    def divide(self, depth: int) -> dict[str, int]:
+        """ perft per legal move, to find a faulty move by comparing with another move generator """
+        nodes = {}
+        for move in self.legal_moves():
+            self.make_move(move)
+            nodes[move_name(move)] = self.perft(depth - 1)
+            self.unmake_move()
+        return nodes
+
+
+class TranspositionTable:
+    """
+    fixed-size hash table of search results in flat arrays, indexed by the low bits of a Zobrist key
+    (8 + 8 + 4 + 4 + 1 = 25 bytes per slot). A slot is replaced unless it holds a deeper result of the current search
+    (see new_search)
+
+    >>> table = TranspositionTable(4)
+    >>> table.store(0x1234, 5, -30, table.LOWER, 4242)
+    >>> table.probe(0x1234), table.probe(0x5234)  # same slot, other key
+    ((5, -30, 2, 4242), None)
+    >>> table.store(0x5234, 3, 0, table.EXACT, 0)  # shallower: kept out
+    >>> table.new_search(); table.store(0x5234, 3, 0, table.EXACT, 0)  # from an older search: replaced
+    >>> table.probe(0x1234), table.probe(0x5234)
+    (None, (3, 0, 1, 0))
+    """
+    EXACT, LOWER, UPPER = 1, 2, 3  # flags, 0 marks an empty slot
+
+    def __init__(self, bits: int = 20) -> None:
+        self.mask = (1 << bits) - 1
+        size = 1 << bits
+        self.keys = array('Q', bytes(8 * size))
+        self.scores = array('q', bytes(8 * size))  # wide enough for perft counts
+        self.moves = array('I', bytes(4 * size))
+        self.depths = array('i', bytes(4 * size))
+        self.flags = array('B', bytes(size))  # flag | generation << 2
+        self.generation = 0
+
+    def new_search(self) -> None:
+        """ ages the stored results, they get replaced first """
+        self.generation = (self.generation + 1) & 63
+
+    def probe(self, key: int) -> tuple[int, int, int, int] | None:
+        """ :return: depth, score, flag, move stored for key """
+        slot = key & self.mask
+        if self.keys[slot] != key or not (flag := self.flags[slot] & 3):
+            return None
+        return self.depths[slot], self.scores[slot], flag, self.moves[slot]
+
+    def store(self, key: int, depth: int, score: int, flag: int, move: int) -> None:
+        slot = key & self.mask
+        if (self.keys[slot] != key and self.flags[slot] & 3 and self.flags[slot] >> 2 == self.generation
+                and self.depths[slot] > depth):
+            return
+        self.keys[slot], self.depths[slot], self.scores[slot] = key, depth, score
+        self.flags[slot], self.moves[slot] = flag | self.generation << 2, move
+
+
+def main(argv=None) -> None:
+    """
+    python chess.py perft [DEPTH] [--fen FEN] [--hash BITS]  (every PERFT_SUITE position without --fen)
+    python chess.py  (runs the doctests and prints the board)
+    """
+    import time
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python chess.py')
+    commands = parser.add_subparsers(dest='command')
+    counter = commands.add_parser('perft', help='count leaf nodes of the move tree')
+    counter.add_argument('depth', type=int, nargs='?', default=4)
+    counter.add_argument('--fen', help='position to count (default: the PERFT_SUITE positions)')
+    counter.add_argument('--hash', type=int, default=0, help='cache subtree counts in 2 ** HASH slots (default: off)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'perft':
+        failed = False
+        for fen in [args.fen] if args.fen else PERFT_SUITE:
+            board = Board(fen)
+            start = time.perf_counter()
+            nodes = board.perft(args.depth, TranspositionTable(args.hash) if args.hash else None)
+            elapsed = time.perf_counter() - start
+            expected = PERFT_SUITE.get(fen, ())[args.depth - 1:args.depth]
+            status = ('ok' if nodes == expected[0] else f'FAILED, expected {expected[0]}') if expected else '?'
+            failed |= status.startswith('FAILED')
+            print(f'{fen}\n  depth {args.depth}: {nodes} nodes, {status}, {elapsed:.2f}s, {nodes / elapsed:,.0f} nodes/s')
+        raise SystemExit(failed)
+    else:
+        import doctest
+
+        doctest.testmod()
+        print(Board())
+
+
+if __name__ == '__main__':
+    main()
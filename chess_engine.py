@@ -0,0 +1,420 @@
+"""
+Chess engine: negamax alpha-beta on chess.Board with iterative deepening, a transposition table, quiescence search,
+MVV-LVA, killer and history move ordering, null-move pruning and time management, driven over UCI
+
+    python chess_engine.py uci  (UCI on stdin/stdout, for a GUI or test harness)
+    python chess_engine.py bench [DEPTH]  (fixed positions, nodes/sec for tracking throughput across releases)
+    python chess_engine.py  (runs the doctests)
+"""
+import sys
+import threading
+import time
+
+from chess import (BISHOP, BLACK, EMPTY, EN_PASSANT, KING, KNIGHT, PAWN, PERFT_SUITE, QUEEN, ROOK, START_FEN, WHITE,
+                   Board, TranspositionTable, move_name)
+
+MATE = 100_000
+MAX_PLY = 128
+VALUES = 100, 320, 330, 500, 900, 0  # per piece type
+# piece-square bonuses per piece type, from white's side, rank 8 first (simplified evaluation function)
+PIECE_SQUARES = (
+    (0, 0, 0, 0, 0, 0, 0, 0, 50, 50, 50, 50, 50, 50, 50, 50, 10, 10, 20, 30, 30, 20, 10, 10,
+     5, 5, 10, 25, 25, 10, 5, 5, 0, 0, 0, 20, 20, 0, 0, 0, 5, -5, -10, 0, 0, -10, -5, 5,
+     5, 10, 10, -20, -20, 10, 10, 5, 0, 0, 0, 0, 0, 0, 0, 0),
+    (-50, -40, -30, -30, -30, -30, -40, -50, -40, -20, 0, 0, 0, 0, -20, -40, -30, 0, 10, 15, 15, 10, 0, -30,
+     -30, 5, 15, 20, 20, 15, 5, -30, -30, 0, 15, 20, 20, 15, 0, -30, -30, 5, 10, 15, 15, 10, 5, -30,
+     -40, -20, 0, 5, 5, 0, -20, -40, -50, -40, -30, -30, -30, -30, -40, -50),
+    (-20, -10, -10, -10, -10, -10, -10, -20, -10, 0, 0, 0, 0, 0, 0, -10, -10, 0, 5, 10, 10, 5, 0, -10,
+     -10, 5, 5, 10, 10, 5, 5, -10, -10, 0, 10, 10, 10, 10, 0, -10, -10, 10, 10, 10, 10, 10, 10, -10,
+     -10, 5, 0, 0, 0, 0, 5, -10, -20, -10, -10, -10, -10, -10, -10, -20),
+    (0, 0, 0, 0, 0, 0, 0, 0, 5, 10, 10, 10, 10, 10, 10, 5, -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5, -5, 0, 0, 0, 0, 0, 0, -5, -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5, 0, 0, 0, 5, 5, 0, 0, 0),
+    (-20, -10, -10, -5, -5, -10, -10, -20, -10, 0, 0, 0, 0, 0, 0, -10, -10, 0, 5, 5, 5, 5, 0, -10,
+     -5, 0, 5, 5, 5, 5, 0, -5, 0, 0, 5, 5, 5, 5, 0, -5, -10, 5, 5, 5, 5, 5, 0, -10,
+     -10, 0, 5, 0, 0, 0, 0, -10, -20, -10, -10, -5, -5, -10, -10, -20),
+    (-30, -40, -40, -50, -50, -40, -40, -30, -30, -40, -40, -50, -50, -40, -40, -30, -30, -40, -40, -50, -50, -40, -40,
+     -30, -30, -40, -40, -50, -50, -40, -40, -30, -20, -30, -30, -40, -40, -30, -30, -20, -10, -20, -20, -20, -20, -20,
+     -20, -10, 20, 20, 0, 0, 0, 0, 20, 20, 20, 30, 10, 0, 0, 10, 30, 20),
+)
+# material and placement per piece (as chess.Board numbers them) and square, positive for white
+PIECE_SCORES = tuple(tuple((VALUES[piece >> 1] + PIECE_SQUARES[piece >> 1][(7 - square // 8) * 8 + square % 8])
+                           if piece & 1 == WHITE else -(VALUES[piece >> 1] + PIECE_SQUARES[piece >> 1][square])
+                           for square in range(64)) for piece in range(12))
+BENCH_POSITIONS = (*PERFT_SUITE, 'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+                   '2r3k1/pp3ppp/2n1b3/3p4/3P4/2PB1N2/P4PPP/R5K1 w - - 0 1')
+
+
+class SearchStopped(Exception):
+    pass
+
+
+def evaluate(board: Board) -> int:
+    """
+    material and piece-square score for the side to move
+
+    >>> evaluate(Board())
+    0
+    >>> evaluate(Board('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNB1KBNR w KQkq - 0 1'))  # without the white queen
+    -895
+    """
+    score = 0
+    for piece, bits in enumerate(board.pieces):
+        scores = PIECE_SCORES[piece]
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            score += scores[low.bit_length() - 1]
+    return score if board.is_white else -score
+
+
+class Engine:
+    """
+    >>> engine = Engine(hash_bits=16)
+    >>> move_name(engine.search(Board('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1'), depth=3))  # back rank mate
+    'a1a8'
+    >>> engine.score
+    99999
+    >>> move_name(engine.search(Board('4k3/8/8/3q4/8/8/3R4/3K4 w - - 0 1'), depth=3))  # takes the queen
+    'd2d5'
+    >>> engine.search(Board('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1'), depth=2, info=print), engine.score  # stalemate
+    (0, 0)
+    """
+
+    def __init__(self, hash_bits: int = 20) -> None:
+        self.table = TranspositionTable(hash_bits)
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 64 for _ in range(12)]
+        self.stopped = threading.Event()
+        self.nodes = self.depth = self.score = 0
+        self.root_best = 0  # best root move so far of the iteration in progress
+        self.deadline = self.node_limit = 0
+
+    def new_game(self) -> None:
+        self.table = TranspositionTable(self.table.mask.bit_length())
+
+    def search(self, board: Board, depth: int = MAX_PLY - 1, movetime: float | None = None,
+               nodes: int | None = None, info=None) -> int:
+        """
+        iterative deepening until depth, movetime (seconds), nodes or stopped is set (stopped is cleared by the
+        caller), the best move of the last finished iteration is returned, or of the iteration that was stopped if
+        its first move (the best one of the iteration before) was searched
+        :param info: called with a UCI info string after each iteration
+        """
+        self.table.new_search()
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 64 for _ in range(12)]
+        self.nodes = 0
+        start = time.perf_counter()
+        self.deadline = start + movetime if movetime else float('inf')
+        self.node_limit = nodes or float('inf')
+        best = next(iter(board.legal_moves()), 0)
+        if not best:  # mate or stalemate: nothing to search or report
+            self.score, self.depth = -MATE if board.in_check() else 0, 0
+            return 0
+        for iteration in range(1, depth + 1):
+            self.root_best = 0
+            try:
+                self.score, move = self.root(board, iteration)
+            except SearchStopped:
+                best = self.root_best or best
+                break
+            best, self.depth = move or best, iteration
+            elapsed = time.perf_counter() - start
+            if info:
+                score = (f'mate {(MATE - abs(self.score) + 1) // 2 * (1 if self.score > 0 else -1)}'
+                         if abs(self.score) > MATE - MAX_PLY else f'cp {self.score}')
+                nps = int(self.nodes / max(elapsed, 1e-6))
+                info(f'info depth {iteration} score {score} nodes {self.nodes} nps {nps}'
+                     f' time {int(elapsed * 1000)} pv {" ".join(map(move_name, self.principal_variation(board)))}')
+            if abs(self.score) > MATE - MAX_PLY or (movetime and elapsed > movetime / 2):
+                break  # a mate is found, or the next iteration would not finish in time
+        return best
+
+    def root(self, board: Board, depth: int) -> tuple[int, int]:
+        alpha, beta, best = -MATE - 1, MATE + 1, 0
+        for move in self.ordered(board, board.pseudo_legal_moves(), self.hashed_move(board), 0):
+            if not self.make(board, move):
+                continue
+            try:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, 1)
+            finally:
+                board.unmake_move()
+            if score > alpha:
+                alpha, best = score, move
+                self.root_best = move  # kept if the iteration is stopped from here on
+        if not best:
+            return (-MATE if board.in_check() else 0), 0
+        self.table.store(board.key, depth, alpha, TranspositionTable.EXACT, best)
+        return alpha, best
+
+    def make(self, board: Board, move: int) -> bool:
+        """ plays a pseudo-legal move, unless it leaves the own king in check """
+        colour = WHITE if board.is_white else BLACK
+        board.make_move(move)
+        if board.is_attacked(board.pieces[KING * 2 + colour].bit_length() - 1, colour ^ 1):
+            board.unmake_move()
+            return False
+        return True
+
+    def check_limits(self) -> None:
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and (self.stopped.is_set() or time.perf_counter() > self.deadline) \
+                or self.nodes > self.node_limit:
+            raise SearchStopped
+
+    def negamax(self, board: Board, depth: int, alpha: int, beta: int, ply: int, null: bool = True) -> int:
+        if board.halfmove >= 100 or board.repetitions():
+            return 0
+        in_check = board.in_check()
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiesce(board, alpha, beta, ply)
+        self.check_limits()
+
+        hashed = 0
+        if entry := self.table.probe(board.key):
+            entry_depth, score, flag, hashed = entry
+            score = score - ply if score > MATE - MAX_PLY else score + ply if score < -MATE + MAX_PLY else score
+            if entry_depth >= depth and (flag == TranspositionTable.EXACT or flag == TranspositionTable.LOWER
+                                         and score >= beta or flag == TranspositionTable.UPPER and score <= alpha):
+                return score
+
+        # null move: if passing still holds beta, a real move will too (not in check or pawn endings: zugzwang)
+        colour = WHITE if board.is_white else BLACK
+        if null and not in_check and depth >= 3 and beta < MATE - MAX_PLY and any(
+                board.pieces[kind * 2 + colour] for kind in (KNIGHT, BISHOP, ROOK, QUEEN)):
+            board.make_null_move()
+            try:
+                score = -self.negamax(board, depth - 3, -beta, -beta + 1, ply + 1, False)
+            finally:
+                board.unmake_null_move()
+            if score >= beta:
+                return beta
+
+        original, best_score, best_move, legal = alpha, -MATE - 1, 0, 0
+        for move in self.ordered(board, board.pseudo_legal_moves(), hashed, ply):
+            capture = board.square[move >> 6 & 63] != EMPTY or move >> 16 == EN_PASSANT
+            if not self.make(board, move):
+                continue
+            legal += 1
+            try:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                if not capture:
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1], killers[0] = killers[0], move
+                    self.history[board.square[move & 63]][move >> 6 & 63] += depth * depth
+                break
+        if not legal:
+            return -MATE + ply if in_check else 0
+
+        flag = (TranspositionTable.UPPER if best_score <= original else
+                TranspositionTable.LOWER if best_score >= beta else TranspositionTable.EXACT)
+        stored = best_score + ply if best_score > MATE - MAX_PLY else best_score - ply if best_score < -MATE + MAX_PLY \
+            else best_score
+        self.table.store(board.key, depth, stored, flag, best_move)
+        return best_score
+
+    def quiesce(self, board: Board, alpha: int, beta: int, ply: int) -> int:
+        """ captures and promotions only, until the position is quiet """
+        self.check_limits()
+        stand = evaluate(board)
+        if stand >= beta or ply >= MAX_PLY - 1:
+            return stand
+        alpha = max(alpha, stand)
+        square = board.square
+        noisy = [move for move in board.pseudo_legal_moves()
+                 if square[move >> 6 & 63] != EMPTY or move >> 12 & 7 or move >> 16 == EN_PASSANT]
+        for move in self.ordered(board, noisy, 0, ply):
+            if not self.make(board, move):
+                continue
+            try:
+                score = -self.quiesce(board, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def ordered(self, board: Board, moves: list[int], hashed: int, ply: int) -> list[int]:
+        """ hash move, captures by MVV-LVA (most valuable victim, least valuable attacker), killers, history """
+        square, killers, history = board.square, self.killers[ply], self.history
+
+        def priority(move):
+            if move == hashed:
+                return 1 << 30
+            victim = square[move >> 6 & 63]
+            if victim != EMPTY or move >> 16 == EN_PASSANT:
+                return (1 << 25) + ((victim >> 1 if victim != EMPTY else PAWN) + 1) * 8 - (square[move & 63] >> 1)
+            if move >> 12 & 7:
+                return 1 << 24
+            if move == killers[0]:
+                return 1 << 23
+            if move == killers[1]:
+                return 1 << 22
+            return history[square[move & 63]][move >> 6 & 63]
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def hashed_move(self, board: Board) -> int:
+        entry = self.table.probe(board.key)
+        return entry[3] if entry else 0
+
+    def principal_variation(self, board: Board) -> list[int]:
+        """ best moves as stored in the transposition table """
+        line = []
+        while len(line) < self.depth and (move := self.hashed_move(board)) and move in board.legal_moves():
+            board.make_move(move)
+            line.append(move)
+            if board.repetitions():
+                break
+        for _ in line:
+            board.unmake_move()
+        return line
+
+
+def time_for_move(remaining: float, increment: float = 0.0, moves_to_go: int | None = None) -> float:
+    """
+    seconds to spend on a move out of the remaining clock time
+
+    >>> time_for_move(60), time_for_move(60, 1), time_for_move(1, moves_to_go=1)
+    (2.0, 2.8, 0.95)
+    """
+    return max(0.01, min(remaining / (moves_to_go or 30) + 0.8 * increment, 0.95 * remaining - 0.05 * (remaining > 1)))
+
+
+def uci(engine: Engine | None = None, read=sys.stdin.readline, write=print) -> None:
+    """
+    the UCI loop: uci, isready, ucinewgame, position [startpos | fen FEN] [moves ...],
+    go [depth D] [movetime MS] [nodes N] [wtime MS btime MS winc MS binc MS movestogo N] [infinite | ponder],
+    stop, ponderhit, quit. An infinite or ponder search holds its bestmove until stop (or ponderhit), a command
+    that cannot be carried out is answered with an info string and otherwise ignored
+
+    >>> script = ['uci', 'isready', 'position startpos moves e2e4 e7e5', 'go depth 2', 'position startpos moves e2e5',
+    ...           'go depth x', 'position startpos', 'quit']
+    >>> commands = iter(script)
+    >>> uci(Engine(16), lambda: next(commands) + '\\n', lambda line: print(*line.split()[:4]))
+    id name chess_engine
+    id author brent-ivens-hg
+    uciok
+    readyok
+    info depth 1 score
+    info depth 2 score
+    bestmove b1c3
+    info string error: illegal
+    info string error: invalid
+    """
+    engine = engine or Engine()
+    board, searcher = Board(), None
+    limit_names = 'depth', 'nodes', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo'
+
+    def output(line):
+        write(line)
+        sys.stdout.flush()
+
+    def go(position, limits, wait):
+        move = engine.search(position, **limits, info=output)
+        if wait:  # UCI: no bestmove before stop, even once the search is done
+            engine.stopped.wait()
+        output(f'bestmove {move_name(move) if move else "0000"}')
+
+    while line := read():
+        command, *args = line.split() or ['']
+        if command in ('go', 'position', 'ucinewgame', 'quit') and searcher:
+            if command == 'quit':
+                engine.stopped.set()
+            searcher.join()  # a new command waits for the search to finish
+            searcher = None
+        try:
+            if command == 'uci':
+                output('id name chess_engine')
+                output('id author brent-ivens-hg')
+                output('uciok')
+            elif command == 'isready':
+                output('readyok')
+            elif command == 'ucinewgame':
+                engine.new_game()
+            elif command == 'position':
+                moves = args.index('moves') if 'moves' in args else len(args)
+                position = Board(START_FEN if args[:1] == ['startpos'] else ' '.join(args[1:moves]))
+                for name in args[moves + 1:]:
+                    position.make_move(position.find_move(name))
+                board = position  # only once every move was legal
+            elif command == 'go':
+                options = {name: int(value) for name, value in zip(args, args[1:]) if name in limit_names}
+                wait = 'infinite' in args or 'ponder' in args
+                limits = {}
+                if 'depth' in options:
+                    limits['depth'] = max(1, options['depth'])
+                if 'nodes' in options:
+                    limits['nodes'] = options['nodes']
+                if wait:
+                    pass
+                elif 'movetime' in options:
+                    limits['movetime'] = options['movetime'] / 1000
+                elif (clock := 'wtime' if board.is_white else 'btime') in options:
+                    increment = options.get('winc' if board.is_white else 'binc', 0)
+                    limits['movetime'] = time_for_move(options[clock] / 1000, increment / 1000,
+                                                       options.get('movestogo'))
+                engine.stopped.clear()
+                searcher = threading.Thread(target=go, args=(board, limits, wait), daemon=True)
+                searcher.start()
+            elif command in ('stop', 'ponderhit'):
+                engine.stopped.set()
+            elif command == 'quit':
+                return
+        except (ValueError, AssertionError, IndexError) as error:
+            output(f'info string error: {error or "invalid command"}')
+    if searcher:  # end of input: stop and report the search
+        engine.stopped.set()
+        searcher.join()
+
+
+def bench(depth: int = 4, out=sys.stdout) -> int:
+    """ searches BENCH_POSITIONS to depth, prints nodes, time and nodes/sec per position and in total """
+    engine, total, start = Engine(), 0, time.perf_counter()
+    for fen in BENCH_POSITIONS:
+        engine.new_game()
+        began = time.perf_counter()
+        move = engine.search(Board(fen), depth)
+        elapsed = time.perf_counter() - began
+        total += engine.nodes
+        out.write(f'{fen}\n  depth {engine.depth}: {move_name(move)}, {engine.nodes} nodes, {elapsed:.2f}s, '
+                  f'{engine.nodes / elapsed:,.0f} nodes/s\n')
+    elapsed = time.perf_counter() - start
+    out.write(f'total: {total} nodes, {elapsed:.2f}s, {total / elapsed:,.0f} nodes/s\n')
+    return total
+
+
+def main(argv=None) -> None:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python chess_engine.py')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('uci', help='play over the Universal Chess Interface').add_argument(
+        '--hash', type=int, default=20, help='2 ** HASH transposition table slots (default: 20)')
+    commands.add_parser('bench', help='search fixed positions, report nodes/sec').add_argument(
+        'depth', type=int, nargs='?', default=4)
+    args = parser.parse_args(argv)
+
+    if args.command == 'uci':
+        uci(Engine(args.hash))
+    elif args.command == 'bench':
+        bench(args.depth)
+    else:
+        import doctest
+
+        doctest.testmod()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""
+Chess positions in bulk: a streaming PGN reader and a memory-mapped store of positions, 32 bytes each
+
+    python chess_store.py ingest STORE FILE...  (.pgn files are replayed move by move, other files hold a FEN a line)
+    python chess_store.py show STORE [INDEX...]  (FEN of stored positions, the count without indexes)
+    python chess_store.py  (runs the doctests)
+
+A record is four little-endian 64-bit words: the occupancy bitboard, then a 4-bit code per occupied square in square
+order (two words, at most 32 pieces) and the Zobrist key (chess.Board.key). Codes 0 to 11 are the pieces of
+chess.Board, the rest fold in the state of the game: CASTLING_ROOK is a rook that may still castle, EN_PASSANT_PAWN
+the pawn that just moved two squares and TO_MOVE_KING the black king with black to move. The clocks are left out, so
+positions that differ only by move counters are the same record.
+"""
+import mmap
+import os
+import re
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from heapq import merge
+
+from chess import (BLACK, CASTLING_RIGHTS, EMPTY, FILES, GRAPHICAL_PIECE, KING, PAWN, RANKS, ROOK, START_FEN, WHITE,
+                   Board)
+
+RECORD = struct.Struct('<4Q')
+CASTLING_ROOK, EN_PASSANT_PAWN, TO_MOVE_KING = 12, 13, 14
+ROOK_CORNERS = 7, 0, 63, 56  # per castling right, in CASTLING_RIGHTS order
+RESULTS = '1-0', '0-1', '1/2-1/2', '*'
+TAG = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\s*]')
+TOKEN = re.compile(r'[{}();]|[^\s{}();]+')
+MOVE_NUMBER = re.compile(r'^\d+\.*')
+
+
+def pack(board: Board) -> bytes:
+    """
+    the 32-byte record of a position
+
+    >>> record = pack(Board())
+    >>> len(record), unpack_fen(record)
+    (32, 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+    >>> unpack_fen(pack(Board('4k3/8/8/8/8/8/8/N3K3 w Q - 0 1')))  # a right without its rook is not stored
+    '4k3/8/8/8/8/8/8/N3K3 w - - 0 1'
+    """
+    square, occupancy = board.square, board.colours[WHITE] | board.colours[BLACK]
+    special = {ROOK_CORNERS[index]: CASTLING_ROOK for index in range(4) if board.castling >> index & 1}
+    if board.en_passant != EMPTY:
+        special[board.en_passant - 8 if board.is_white else board.en_passant + 8] = EN_PASSANT_PAWN
+    if not board.is_white:
+        special[board.pieces[KING * 2 + BLACK].bit_length() - 1] = TO_MOVE_KING
+    codes, shift, bits = 0, 0, occupancy
+    while bits:
+        low = bits & -bits
+        bits ^= low
+        index = low.bit_length() - 1
+        codes |= special.get(index, square[index]) << shift
+        shift += 4
+    assert shift <= 128, 'more than 32 pieces'
+    return RECORD.pack(occupancy, codes & 0xffff_ffff_ffff_ffff, codes >> 64, board.key)
+
+
+def unpack_fen(record: bytes | tuple[int, int, int, int]) -> str:
+    """ FEN of a record (bytes or the words of RECORD), without building a Board """
+    occupancy, low, high, _ = RECORD.unpack(record) if isinstance(record, (bytes, memoryview)) else record
+    codes, placement = low | high << 64, [EMPTY] * 64
+    black_to_move, castling, en_passant = False, 0, '-'
+    while occupancy:
+        bit = occupancy & -occupancy
+        occupancy ^= bit
+        index, code = bit.bit_length() - 1, codes & 15
+        codes >>= 4
+        if code == CASTLING_ROOK:
+            castling |= 1 << ROOK_CORNERS.index(index)
+            code = ROOK * 2 + (index >= 56)
+        elif code == TO_MOVE_KING:
+            black_to_move, code = True, KING * 2 + BLACK
+        placement[index] = code
+    for index, code in enumerate(placement):
+        if code == EN_PASSANT_PAWN:
+            colour = WHITE if black_to_move else BLACK
+            placement[index] = PAWN * 2 + colour
+            behind = index - 8 if colour == WHITE else index + 8
+            en_passant = FILES[behind % 8] + RANKS[behind // 8]
+    rows = []
+    for rank in range(7, -1, -1):
+        row = ''.join(GRAPHICAL_PIECE[code] if code != EMPTY else '1' for code in placement[rank * 8:rank * 8 + 8])
+        rows.append(re.sub('1+', lambda run: str(len(run.group())), row))
+    rights = ''.join(right for index, right in enumerate(CASTLING_RIGHTS) if castling >> index & 1) or '-'
+    return f'{"/".join(rows)} {"b" if black_to_move else "w"} {rights} {en_passant} 0 1'
+
+
+class PositionStore:
+    """
+    positions appended to a file of RECORDs, read back through a memory map: by index, by key or all at once
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'positions.bin')
+    >>> with PositionStore(path) as store:
+    ...     board = Board()
+    ...     for name in ['g1f3', 'g8f6', 'f3g1', 'f6g8', 'e2e4']:
+    ...         board.make_move(board.find_move(name))
+    ...         _ = store.add(board)
+    ...     len(store), store.fen(4), os.path.getsize(path)  # the start position came back once, kept once
+    (5, 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1', 160)
+    >>> with PositionStore(path) as store:  # reopened: the keys of the file keep deduplicating
+    ...     store.add(Board()), store.index(Board().key), sum(1 for _ in store)
+    (False, 3, 5)
+    >>> with open(path, 'ab') as file:  # a write cut short
+    ...     _ = file.write(bytes(20))
+    >>> with PositionStore(path) as store:
+    ...     len(store), os.path.getsize(path)
+    (5, 160)
+
+    Keys are deduplicated through a sorted array of (key, index) pairs, 16 bytes a position, and a dict of the keys
+    added since the last merge into it, kept under a quarter of the array (at least PENDING keys)
+    """
+    PENDING = 1 << 16
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, 'a+b')
+        self.count = os.path.getsize(path) // RECORD.size
+        if os.path.getsize(path) != self.count * RECORD.size:  # a partial record would shift every later one
+            self.file.truncate(self.count * RECORD.size)
+        self.map = None
+        self.mapped = 0  # records covered by the map
+        self.sorted_keys = self.sorted_indexes = None  # read from the file on the first add or index
+        self.pending = {}  # key -> index of the positions added since
+
+    def __enter__(self) -> 'PositionStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def view(self) -> mmap.mmap | bytes:
+        """ a map of every record written so far """
+        if self.mapped < self.count:
+            self.file.flush()
+            if self.map:
+                self.map.close()
+            self.map, self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ), self.count
+        return self.map or b''
+
+    def add(self, board: Board) -> bool:
+        """ appends the position unless the store has it, :return: whether it was added """
+        if self.index(board.key) is not None:
+            return False
+        self.pending[board.key] = self.count
+        self.file.write(pack(board))
+        self.count += 1
+        if len(self.pending) > max(self.PENDING, len(self.sorted_keys) // 4):
+            self.merge()
+        return True
+
+    def index(self, key: int) -> int | None:
+        """ the index of the position with this key, None if the store does not have it """
+        if self.sorted_keys is None:
+            keys = array('Q', (record[3] for record in RECORD.iter_unpack(self.view())))
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            self.sorted_keys = array('Q', map(keys.__getitem__, order))
+            self.sorted_indexes = array('Q', order)
+        if key in self.pending:
+            return self.pending[key]
+        position = bisect_left(self.sorted_keys, key)
+        if position < len(self.sorted_keys) and self.sorted_keys[position] == key:
+            return self.sorted_indexes[position]
+        return None
+
+    def merge(self) -> None:
+        """ moves the pending keys into the sorted arrays """
+        keys, indexes = array('Q'), array('Q')
+        for key, index in merge(zip(self.sorted_keys, self.sorted_indexes), sorted(self.pending.items())):
+            keys.append(key)
+            indexes.append(index)
+        self.sorted_keys, self.sorted_indexes, self.pending = keys, indexes, {}
+
+    def __getitem__(self, index: int) -> bytes:
+        if not -self.count <= index < self.count:
+            raise IndexError('position index out of range')
+        offset = (index % self.count) * RECORD.size
+        return self.view()[offset:offset + RECORD.size]
+
+    def fen(self, index: int) -> str:
+        return unpack_fen(self[index])
+
+    def board(self, index: int) -> Board:
+        return Board(self.fen(index))
+
+    def __iter__(self):
+        """ the words (occupancy, low codes, high codes, key) of every record, straight from the map """
+        return RECORD.iter_unpack(self.view())
+
+
+def read_pgn(lines):
+    """
+    games of PGN text, one at a time: comments, variations, move numbers and annotations are skipped
+
+    :param lines: any iterable of lines, e.g. an open file, read as far as the game yielded
+    :return: (tags, moves in SAN) per game
+
+    >>> text = '''[Event "Example"]
+    ... [Result "1-0"]
+    ...
+    ... 1. e4 e5 2. Nf3 {a comment
+    ... over two lines} Nc6 (2... d6 3. d4) 3. Bb5 $1 a6 1-0
+    ...
+    ... [Event "Second"]
+    ... 1.d4 d5 *'''
+    >>> [(tags['Event'], moves) for tags, moves in read_pgn(text.splitlines())]
+    [('Example', ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6']), ('Second', ['d4', 'd5'])]
+    """
+    tags, moves, comment, depth = {}, [], False, 0
+    for line in lines:
+        if not comment and line.startswith('['):
+            if moves:  # a game without a result
+                yield tags, moves
+                tags, moves = {}, []
+            tags.update((name, value.replace('\\"', '"')) for name, value in TAG.findall(line))
+            continue
+        if not comment and line.startswith('%'):
+            continue
+        for token in TOKEN.findall(line):
+            if comment:
+                comment = token != '}'
+            elif token == '{':
+                comment = True
+            elif token == ';':
+                break
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            elif depth or token[0] == '$':
+                continue
+            elif token in RESULTS:
+                yield tags, moves
+                tags, moves = {}, []
+            elif move := MOVE_NUMBER.sub('', token):
+                moves.append(move)
+    if moves:
+        yield tags, moves
+
+
+def replay(tags: dict[str, str], moves: list[str]):
+    """
+    the positions of a game, from its start (the FEN tag, if any) through each move: one Board, updated in place
+
+    >>> [board.fen().split()[0] for board in replay({}, ['e4', 'd5', 'exd5'])][-1]
+    'rnbqkbnr/ppp1pppp/8/3P4/8/8/PPPP1PPP/RNBQKBNR'
+    """
+    board = Board(tags.get('FEN', START_FEN))
+    yield board
+    for san in moves:
+        board.make_move(board.parse_san(san))
+        yield board
+
+
+def ingest(store: PositionStore, path: str) -> dict[str, int]:
+    """ adds the positions of a PGN file (by extension) or a file of FEN lines, :return: counts """
+    counts = {'games': 0, 'invalid': 0, 'positions': 0, 'added': 0}
+    with open(path, encoding='utf-8', errors='replace') as file:
+        if path.lower().endswith('.pgn'):
+            for tags, moves in read_pgn(file):
+                counts['games'] += 1
+                try:
+                    for board in replay(tags, moves):
+                        counts['positions'] += 1
+                        counts['added'] += store.add(board)
+                except (ValueError, AssertionError):
+                    counts['invalid'] += 1
+        else:
+            for line in file:
+                if line.strip():
+                    try:
+                        board = Board(line)
+                    except (ValueError, AssertionError):
+                        counts['invalid'] += 1
+                        continue
+                    counts['positions'] += 1
+                    counts['added'] += store.add(board)
+    return counts
+
+
+def main(argv=None) -> None:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python chess_store.py')
+    commands = parser.add_subparsers(dest='command')
+    loader = commands.add_parser('ingest', help='add the positions of PGN or FEN files')
+    loader.add_argument('store')
+    loader.add_argument('files', nargs='+')
+    reader = commands.add_parser('show', help='print stored positions as FEN')
+    reader.add_argument('store')
+    reader.add_argument('indexes', type=int, nargs='*')
+    args = parser.parse_args(argv)
+
+    if args.command == 'ingest':
+        with PositionStore(args.store) as store:
+            for path in args.files:
+                start = time.perf_counter()
+                counts = ingest(store, path)
+                elapsed = time.perf_counter() - start
+                print(f'{path}: {", ".join(f"{count} {name}" for name, count in counts.items())}, {elapsed:.2f}s, '
+                      f'{counts["positions"] / max(elapsed, 1e-9):,.0f} positions/s')
+            print(f'{args.store}: {len(store)} positions')
+    elif args.command == 'show':
+        with PositionStore(args.store) as store:
+            for index in args.indexes:
+                print(store.fen(index))
+            if not args.indexes:
+                print(len(store))
+    else:
+        import doctest
+
+        doctest.testmod()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+Texas Hold'em
+"""
+import mmap
+import os
+import re
+from array import array
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, lru_cache
+from itertools import combinations, islice, permutations
+from math import comb
+from random import Random
+
+from poker_hands import CARD_INT, DECK, FLUSH_TABLE, PRIMES, PRODUCT_TABLE, RANKS, RANK_VALUE, SUITS, UNIQUE5_TABLE
+
+TABLE_PATH = os.environ.get('HOLDEM_TABLE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'holdem7.bin'))
+TABLE_MAGIC = 0x37454848  # 'HHE7', written in native byte order
+TABLE_VERSION = 1
+STRIDE = 14  # 13 transitions (one per rank) + strength of the state
+
+RANGE_PATTERN = re.compile(rf'([{RANKS}])([{RANKS}])([so]?)(\+?)')  # first rank, second rank, suitedness, plus
+SHARDS = 64  # equity is split into this many shards whatever the number of workers, so seeds do not depend on it
+SUIT_COUNT = (0, 1, 1 << 4, 0, 1 << 8, 0, 0, 0, 1 << 12)  # suit bit -> suit counter increment
+
+
+def build_table() -> array:
+    """
+    State-transition table over rank multisets of up to 7 cards, in the style of the "two-plus-two" evaluator.
+
+    A state is an offset into the table: table[state + rank] is the state after adding a card of that rank,
+    table[state + 13] the strength of the best non-flush 5 cards of a state holding 5 to 7 cards.
+    With 5 or more cards of one suit no Full House or better is possible, so flushes are resolved apart:
+    table[flush_offset + mask] is the best flush strength of a 13-bit rank mask (flush_offset: len(table) - 8192).
+    """
+    states = {(): 0}
+    layer = [()]
+    for _ in range(7):
+        following = []
+        for ranks in layer:
+            for rank in range(ranks[-1] if ranks else 0, 13):  # ranks ascending, each multiset once
+                if ranks[-4:] != (rank,) * 4:
+                    following.append(ranks + (rank,))
+        states.update((ranks, len(states) * STRIDE) for ranks in following)
+        layer = following
+
+    table = array('i', bytes(4 * STRIDE * len(states)))
+    for ranks, state in states.items():
+        for rank in range(13):
+            table[state + rank] = states.get(tuple(sorted(ranks + (rank,))), 0)
+        if len(ranks) >= 5:
+            table[state + 13] = max(
+                UNIQUE5_TABLE[mask] if (mask := sum(1 << rank for rank in subset)).bit_count() == 5 else
+                PRODUCT_TABLE[PRIMES[subset[0]] * PRIMES[subset[1]] * PRIMES[subset[2]] *
+                              PRIMES[subset[3]] * PRIMES[subset[4]]]
+                for subset in combinations(ranks, 5))
+
+    flush = array('i', [-1]) * 8192
+    for mask in range(8192):
+        if mask.bit_count() >= 5:
+            ranks = [1 << rank for rank in range(13) if mask >> rank & 1]
+            flush[mask] = max(FLUSH_TABLE[sum(subset)] for subset in combinations(ranks, 5))
+    return table + flush
+
+
+def save_table(table: array, path: str = TABLE_PATH) -> None:
+    """ writes the table as a header (magic, version, length) followed by native int32s """
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        array('i', (TABLE_MAGIC, TABLE_VERSION, len(table))).tofile(file)
+        table.tofile(file)
+    os.replace(temporary, path)  # atomic, concurrent readers never see a partial table
+
+
+def load_table(path: str = TABLE_PATH) -> memoryview:
+    """ memory-maps a table written by save_table, pages are shared between processes """
+    with open(path, 'rb') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapping) % 4:  # truncated, cast would raise a TypeError
+        mapping.close()
+        raise ValueError(f'{path!r} is not a compatible hold\'em table')
+    view = memoryview(mapping).cast('i')
+    if len(view) < 3 or tuple(view[:2]) != (TABLE_MAGIC, TABLE_VERSION) or view[2] != len(view) - 3:
+        raise ValueError(f'{path!r} is not a compatible hold\'em table')
+    return view[3:]
+
+
+@cache
+def get_table(path: str = TABLE_PATH) -> memoryview:
+    """ loads the table, generating and persisting it first if missing or stale """
+    try:
+        return load_table(path)
+    except (OSError, ValueError):
+        save_table(build_table(), path)
+    return load_table(path)
+
+
+def evaluate7(cards: Sequence[int], table: memoryview | None = None) -> int:
+    """
+    Strength of the best 5 out of 5 to 7 integer encoded cards (see poker_hands.get_card_int),
+    on the same scale as poker_hands.evaluate / PokerHand.strength.
+
+    >>> from random import sample, seed
+    >>> from poker_hands import DECK, PokerHand, get_hand_value
+
+    >>> get_hand_value(evaluate7([CARD_INT[card] for card in ('AS', 'KS', 'QD', 'JC', 'TS', '2S', '3S')]))
+    <HandValue.FLUSH: 'Flush'>
+    >>> seed(7)
+    >>> hands = [sample(DECK, k=7) for _ in range(500)]
+    >>> all(evaluate7([CARD_INT[card] for card in hand]) ==
+    ...     max(PokerHand(cards).strength for cards in combinations(hand, 5)) for hand in hands)
+    True
+    """
+    if table is None:
+        table = get_table()
+    state = suits = 0
+    for card in cards:
+        state = table[state + (card >> 8 & 0xF)]
+        suits += SUIT_COUNT[card >> 12 & 0xF]
+    if flush := (suits + 0x3333) & 0x8888:  # a suit counted 5 or more
+        suit = 1 << 12 + (flush.bit_length() - 4 >> 2)
+        mask = 0
+        for card in cards:
+            if card & suit:
+                mask |= card >> 16
+        return table[len(table) - 8192 + mask]
+    return table[state + 13]
+
+
+def evaluate_hand(cards: Sequence[str]) -> int:
+    """
+    >>> from poker_hands import STRENGTH_KEY
+
+    >>> STRENGTH_KEY[evaluate_hand(['7S', '7D', 'AS', 'AC', 'AH', '7C', 'KD'])]
+    (6, 12, 5)
+    """
+    return evaluate7([CARD_INT[card] for card in cards])
+
+
+def tally(holes: Sequence[tuple], board: tuple, boards, table: memoryview) -> list[list]:
+    """
+    Showdowns of every player over each completion of the board.
+    The board is walked through the table once, each player then only adds its 2 hole cards.
+
+    :return: per player wins, ties, losses and pot share (a tie splits the pot between the winners)
+    """
+    tallies = [[0, 0, 0, 0.0] for _ in holes]
+    for extra in boards:
+        cards = board + extra
+        state = suits = 0
+        for card in cards:
+            state = table[state + (card >> 8 & 0xF)]
+            suits += SUIT_COUNT[card >> 12 & 0xF]
+        strengths = [
+            evaluate7((first, second, *cards), table)
+            if (suits + SUIT_COUNT[first >> 12 & 0xF] + SUIT_COUNT[second >> 12 & 0xF] + 0x3333) & 0x8888 else
+            table[table[table[state + (first >> 8 & 0xF)] + (second >> 8 & 0xF)] + 13]
+            for first, second in holes]
+        best = max(strengths)
+        winners = strengths.count(best)
+        for strength, counts in zip(strengths, tallies):
+            if strength != best:
+                counts[2] += 1
+            elif winners == 1:
+                counts[0] += 1
+                counts[3] += 1
+            else:
+                counts[1] += 1
+                counts[3] += 1 / winners
+    return tallies
+
+
+def equity_worker(holes: Sequence[tuple], board: tuple, remaining: Sequence[int],
+                  index: int, shards: int, samples: int | None, seed: int) -> list[list]:
+    """
+    One shard of an equity calculation: every shards-th board completion starting at index,
+    or its share of the samples drawn from an RNG seeded by (seed, index)
+    """
+    table = get_table()
+    missing = 5 - len(board)
+    if samples is None:
+        boards = islice(combinations(remaining, missing), index, None, shards)
+    else:
+        rng = Random(seed * 1_000_003 + index)
+        share = samples // shards + (index < samples % shards)
+        boards = (tuple(rng.sample(remaining, k=missing)) for _ in range(share))
+    return tally(holes, board, boards, table)
+
+
+def equity(hands: Sequence[Sequence[str]], board: Sequence[str] = (), dead: Sequence[str] = (),
+           samples: int = 20_000, exhaustive_limit: int = 50_000, workers: int | None = None,
+           seed: int = 0) -> list[tuple]:
+    """
+    All-in equity of each player's hole cards.
+    Enumerates every completion of the board if there are at most exhaustive_limit, samples otherwise.
+
+    :param hands: 2 hole cards per player
+    :param board: 0 to 5 community cards
+    :param dead: cards known to be out of the deck
+    :param samples: number of boards to sample (Monte Carlo)
+    :param workers: processes to spread the SHARDS over (default: one per CPU)
+    :param seed: base of the per-shard seeds, equal arguments give equal results, whatever workers is
+    :return: per player (win, tie, lose, equity) as fractions, equity counting a tie as a split pot
+
+    >>> [tuple(round(fraction, 4) for fraction in player)  # exhaustive
+    ...  for player in equity([('AS', 'AH'), ('KS', 'KH')], board=('2D', '7C', '9C'), workers=1)]
+    [(0.9162, 0.0, 0.0838, 0.9162), (0.0838, 0.0, 0.9162, 0.0838)]
+    >>> hands = [('AS', 'AH'), ('KS', 'KH'), ('QD', 'JD'), ('7C', '8C'), ('2S', '2D'), ('AD', 'KC')]
+    >>> equity(hands, samples=2_000, workers=1, seed=1) == equity(hands, samples=2_000, workers=2, seed=1)
+    True
+    """
+    holes = [tuple(map(CARD_INT.__getitem__, hand)) for hand in hands]
+    known = [card for hole in holes for card in hole] + [CARD_INT[card] for card in (*board, *dead)]
+    assert all(len(hole) == 2 for hole in holes), 'each hand should consist of 2 cards'
+    assert len(board) <= 5, 'board should have at most 5 cards'
+    assert len(set(known)) == len(known), 'cards should be distinct'
+    remaining = [CARD_INT[card] for card in DECK if CARD_INT[card] not in known]
+    board = tuple(map(CARD_INT.__getitem__, board))
+
+    if comb(len(remaining), 5 - len(board)) <= exhaustive_limit:
+        samples = None
+    workers = workers or os.cpu_count() or 1
+    arguments = [(holes, board, remaining, index, SHARDS, samples, seed) for index in range(SHARDS)]
+    if workers == 1:
+        shards = [equity_worker(*shard) for shard in arguments]
+    else:
+        get_table()  # generate the table once, up front, instead of in every worker
+        with ProcessPoolExecutor(workers) as executor:
+            shards = list(executor.map(equity_worker, *zip(*arguments), chunksize=-(-SHARDS // workers)))
+
+    totals = [[sum(column) for column in zip(*tallies)] for tallies in zip(*shards)]
+    boards = sum(totals[0][:3])
+    return [(wins / boards, ties / boards, losses / boards, share / boards)
+            for wins, ties, losses, share in totals]
+
+
+def parse_range(text: str) -> list[tuple]:
+    """
+    Hole card combinations of a range like 'QQ+, AKs, A5s-A2s':
+    pairs (QQ), suited (AKs), offsuit (AKo) or both (AK), each optionally followed by '+' (up to Aces / up to the
+    kicker below the first rank) or given as a span ('99-66', 'A5s-A2s' with equal first ranks).
+
+    >>> len(parse_range('QQ+')), len(parse_range('AKs')), len(parse_range('AKo')), len(parse_range('AK'))
+    (18, 4, 12, 16)
+    >>> parse_range('A5s-A2s')[:5]
+    [('AS', '5S'), ('AD', '5D'), ('AC', '5C'), ('AH', '5H'), ('AS', '4S')]
+    >>> sorted(parse_range('ATs+')) == sorted(parse_range('AKs, AQs, AJs, ATs'))
+    True
+    >>> parse_range('AKs-QJs')
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid range 'AKs-QJs'
+    """
+    combos = {}
+    for token in filter(None, map(str.strip, text.split(','))):
+        first, _, last = token.partition('-')
+        match, span = RANGE_PATTERN.fullmatch(first), RANGE_PATTERN.fullmatch(last or first)
+        if not match or not span or (last and (match[4] or span[4] or match[3] != span[3])):
+            raise ValueError(f'invalid range {token!r}')
+        high, low = sorted((RANK_VALUE[match[1]], RANK_VALUE[match[2]]), reverse=True)
+        high2, low2 = sorted((RANK_VALUE[span[1]], RANK_VALUE[span[2]]), reverse=True)
+        if high == low:
+            if match[3] or high2 != low2:
+                raise ValueError(f'invalid range {token!r}')
+            ranks = [(rank, rank) for rank in range(12 if match[4] else max(low, low2), min(low, low2) - 1, -1)]
+        else:
+            if high2 != high:
+                raise ValueError(f'invalid range {token!r}')
+            ranks = [(high, rank) for rank in range(high - 1 if match[4] else max(low, low2), min(low, low2) - 1, -1)]
+
+        for high, low in ranks:
+            if high == low:
+                combos.update(dict.fromkeys(
+                    (RANKS[high] + suit1, RANKS[low] + suit2) for suit1, suit2 in combinations(SUITS, 2)))
+            else:
+                combos.update(dict.fromkeys(
+                    (RANKS[high] + suit1, RANKS[low] + suit2) for suit2 in SUITS for suit1 in SUITS
+                    if match[3] != ('o' if suit1 == suit2 else 's')))
+    return list(combos)
+
+
+def canonical(hands: Sequence[Sequence[str]], board: Sequence[str] = ()) -> tuple:
+    """
+    Representative of a matchup under the 24 suit permutations, all of which have equal equities.
+
+    >>> canonical([('AS', 'KS'), ('QD', 'QH')]) == canonical([('AH', 'KH'), ('QC', 'QS')])
+    True
+    """
+    return min(
+        (tuple(tuple(sorted(card.translate(suits) for card in hand)) for hand in hands),
+         tuple(sorted(card.translate(suits) for card in board)))
+        for suits in (str.maketrans(SUITS, ''.join(permutation)) for permutation in permutations(SUITS)))
+
+
+@lru_cache(maxsize=65_536)
+def matchup_equity(hands: tuple, board: tuple, samples: int, seed: int) -> tuple:
+    """ equity of the first player in a canonical matchup, memoized across queries """
+    return equity(hands, board, samples=samples, workers=1, seed=seed)[0]
+
+
+def range_equity(range1: str, range2: str, board: Sequence[str] = (), samples: int = 2_000, seed: int = 0) -> tuple:
+    """
+    All-in equity of range1 against range2, every non-conflicting pair of combinations weighted equally.
+    Suit-isomorphic matchups are collapsed to their canonical form and evaluated only once (matchup_equity).
+
+    :return: (win, tie, lose, equity) of range1
+
+    >>> tuple(round(fraction, 2) for fraction in range_equity('AA', 'KK', board=('2D', '7C', '9C')))
+    (0.91, 0.0, 0.09, 0.91)
+    >>> result = range_equity('QQ+, AKs', 'A5s-A2s', samples=200)
+    >>> misses = matchup_equity.cache_info().misses
+    >>> range_equity('QQ+, AKs', 'A5s-A2s', samples=200) == result, matchup_equity.cache_info().misses == misses
+    (True, True)
+    """
+    board = tuple(board)
+    matchups = {}
+    for hand1 in parse_range(range1):
+        for hand2 in parse_range(range2):
+            if len({*hand1, *hand2, *board}) == 4 + len(board):
+                key = canonical((hand1, hand2), board)
+                matchups[key] = matchups.get(key, 0) + 1
+    assert matchups, 'ranges should have non-conflicting combinations'
+
+    total = sum(matchups.values())
+    results = [(matchup_equity(*key, samples, seed), count) for key, count in matchups.items()]
+    return tuple(sum(result[i] * count for result, count in results) / total for i in range(4))
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
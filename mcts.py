@@ -0,0 +1,179 @@
+"""
+Monte Carlo Tree Search (UCT) for m,n,k-games (mnk.MNKBoard, TicTacToe is MNKBoard(3, 3, 3))
+
+Nodes live in preallocated flat arrays (children of a node are contiguous), capped at max_nodes: once full the
+tree stops growing and playouts start from its leaves. Between moves the subtree of the position reached is kept
+and compacted in place to the front of the arrays.
+"""
+import time
+from array import array
+from math import log, sqrt
+from random import Random
+
+from mnk import EMPTY
+
+
+class MCTS:
+    """
+    >>> from mnk import MNKBoard
+
+    >>> board = MNKBoard(3, 3, 3)
+    >>> players = MCTS(playouts=3000, seed=1), MCTS(playouts=3000, seed=2)
+    >>> while not board.game_over():
+    ...     _ = board.place(players[len(board.moves) % 2].choose(board))
+    >>> board.winner  # both sides hold the draw
+    0
+
+    >>> board = MNKBoard(3, 3, 3)
+    >>> for cell in (0, 4, 1):
+    ...     _ = board.place(cell)
+    >>> player = MCTS(playouts=2000, seed=0)
+    >>> player.choose(board)  # O has to block the top row
+    2
+    >>> _ = board.place(2); _ = board.place(6)  # O blocks, X blocks the diagonal
+    >>> player.choose(board) and player.reused > 0  # the tree below the two moves was kept
+    True
+    """
+
+    def __init__(self, playouts=None, budget=1.0, max_nodes=1 << 20, exploration=1.4, seed=None):
+        """
+        :param playouts: playouts per move, else as many as fit in budget (seconds)
+        :param max_nodes: bound on the tree, 22 bytes per node (and a byte per node while rerooting)
+        """
+        assert playouts or budget, 'give a playout or time budget'
+        self.playouts, self.budget = playouts, budget
+        self.max_nodes = max_nodes
+        self.exploration = exploration
+        self.rng = Random(seed)
+        self.root_moves = None  # board.moves at the root of the tree
+        self.reused = 0
+        self.move, self.first, self.count = array('i', [0]) * max_nodes, array('i', [-1]) * max_nodes, \
+            array('H', [0]) * max_nodes
+        self.visits, self.wins = array('i', [0]) * max_nodes, array('d', [0.0]) * max_nodes
+        self.nodes = 1
+
+    def reset(self):
+        """ an empty tree, in the same arrays: expand initialises the nodes it adds """
+        self.first[0], self.count[0], self.visits[0], self.wins[0] = -1, 0, 0, 0.0
+        self.nodes = 1
+
+    def reroot(self, board):
+        """ keeps the subtree of the current position if the tree has seen it, else starts a new tree """
+        self.reused = 0
+        moves = board.moves
+        if self.root_moves is None or moves[:len(self.root_moves)] != self.root_moves:
+            return self.reset()
+        node = 0
+        for played in moves[len(self.root_moves):]:
+            first = self.first[node]
+            node = next((child for child in range(first, first + self.count[node]) if self.move[child] == played),
+                        None) if first >= 0 else None
+            if node is None:
+                return self.reset()
+
+        # mark the subtree (a byte per node), then slide it to the front in place: nodes keep their order, so
+        # children stay contiguous and the subtree root, allocated before its descendants, lands on 0
+        move, first, count, visits, wins = self.move, self.first, self.count, self.visits, self.wins
+        kept, stack = bytearray(self.nodes), [node]
+        kept[node] = 1
+        while stack:
+            parent = stack.pop()
+            if (start := first[parent]) >= 0:
+                kept[start:start + count[parent]] = b'\x01' * count[parent]
+                stack.extend(child for child in range(start, start + count[parent]) if first[child] >= 0)
+        kept_before = array('i', [0])  # kept nodes before each block of 256
+        for block in range(0, self.nodes, 256):
+            kept_before.append(kept_before[-1] + kept.count(1, block, block + 256))
+
+        size = 0
+        for index in range(node, self.nodes):
+            if not kept[index]:
+                continue
+            start = first[index]
+            if start >= 0:
+                start = kept_before[start >> 8] + kept.count(1, start & ~255, start)
+            move[size], first[size], count[size] = move[index], start, count[index]
+            visits[size], wins[size] = visits[index], wins[index]
+            size += 1
+        self.nodes = self.reused = size
+
+    def choose(self, board):
+        """ most visited move after the playout or time budget """
+        assert not board.game_over(), 'game is over'
+        self.reroot(board)
+        deadline = time.perf_counter() + (self.budget or float('inf'))
+        done = 0
+        while (done < self.playouts) if self.playouts else (time.perf_counter() < deadline):
+            self.iterate(board)
+            done += 1
+        self.root_moves = board.moves[:]
+        first, count = self.first[0], self.count[0]
+        return self.move[max(range(first, first + count), key=self.visits.__getitem__)]
+
+    def iterate(self, board):
+        """ one selection, expansion, playout and backpropagation, the board is restored afterwards """
+        move, first, count, visits, wins = self.move, self.first, self.count, self.visits, self.wins
+        node, path = 0, [0]
+        while first[node] >= 0 and not board.winner:
+            start = first[node]
+            scale = self.exploration * sqrt(log(visits[node] + 1))
+            best, best_value = start, -1.0
+            for child in range(start, start + count[node]):
+                if not visits[child]:
+                    best = child
+                    break
+                value = wins[child] / visits[child] + scale / sqrt(visits[child])
+                if value > best_value:
+                    best, best_value = child, value
+            node = best
+            board.place(move[node])
+            path.append(node)
+
+        if not board.game_over() and (visits[node] or node == 0) and self.expand(node, board):
+            node = first[node]
+            board.place(move[node])
+            path.append(node)
+
+        winner = self.playout(board)
+        for _ in range(len(path) - 1):
+            board.undo()
+
+        mover = 3 - board.player  # made the move into the root, the movers alternate down the path
+        for node in path:
+            visits[node] += 1
+            wins[node] += 1.0 if winner == mover else 0.5 if winner == EMPTY else 0.0
+            mover = 3 - mover
+
+    def expand(self, node, board):
+        moves = board.legal_moves()
+        if self.nodes + len(moves) > self.max_nodes:
+            return False
+        self.rng.shuffle(moves)
+        start = self.first[node] = self.nodes
+        self.count[node] = len(moves)
+        move, first, count, visits, wins = self.move, self.first, self.count, self.visits, self.wins
+        for child, cell in enumerate(moves, start):
+            move[child], first[child], count[child], visits[child], wins[child] = cell, -1, 0, 0, 0.0
+        self.nodes += len(moves)
+        return True
+
+    def playout(self, board):
+        """ random moves to the end on a scratch copy of the cells: :return: the winner or EMPTY """
+        if board.winner:
+            return board.winner
+        cells = bytearray(board.cells)
+        empty = [cell for cell in range(board.size) if not cells[cell]]
+        self.rng.shuffle(empty)
+        player = board.player
+        for cell in empty:
+            cells[cell] = player
+            if board.completes_line(cell, player, cells):
+                return player
+            player = 3 - player
+        return EMPTY
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
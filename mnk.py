@@ -0,0 +1,255 @@
+"""
+m,n,k-games: k in a row on an m x n board (TicTacToe: 3,3,3, Gomoku: 15,15,5)
+
+The board keeps its win check, evaluation and Zobrist hash incremental: placing a stone only looks at the lines
+through it. AlphaBeta searches it with iterative deepening under a wall-clock budget per move.
+"""
+import time
+from random import Random
+
+EMPTY, X, O = 0, 1, 2
+MARKS = '_XO'
+DIRECTIONS = (0, 1), (1, 0), (1, 1), (1, -1)  # (row, column) steps: horizontal, vertical, both diagonals
+WIN = 1_000_000
+
+
+class MNKBoard:
+    """
+    >>> board = MNKBoard(3, 3, 3)
+    >>> [board.place(cell) for cell in (0, 3, 1, 4, 2)]
+    [False, False, False, False, True]
+    >>> print(board)
+    X X X
+    O O _
+    _ _ _
+    >>> board.winner, board.game_over()
+    (1, True)
+    >>> board.undo(), board.winner
+    (2, 0)
+    >>> other = MNKBoard(3, 3, 3)
+    >>> _ = [other.place(cell) for cell in (1, 4, 0, 3)]
+    >>> other.hash == board.hash  # same position, same Zobrist key
+    True
+    """
+
+    def __init__(self, m=15, n=15, k=5, seed=0):
+        self.m, self.n, self.k = m, n, k
+        self.size = m * n
+        self.cells = bytearray(self.size)
+        self.player = X
+        self.moves = []
+        self.winner = EMPTY
+        self.score = 0  # evaluation from X's point of view
+
+        rng = Random(seed)
+        self.zobrist = [[0] * self.size, [rng.getrandbits(64) for _ in range(self.size)],
+                        [rng.getrandbits(64) for _ in range(self.size)]]
+        self.side = rng.getrandbits(64)
+        self.hash = 0
+
+        # per cell and direction: the cells up to k - 1 steps away on either side (nearest first)
+        self.rays = [[(self.ray(cell, dr, dc), self.ray(cell, -dr, -dc)) for dr, dc in DIRECTIONS]
+                     for cell in range(self.size)]
+        # every window of k cells in a row, and per cell the windows containing it
+        self.windows = [[cell, *forward[:k - 1]] for cell in range(self.size)
+                        for forward, _ in self.rays[cell] if len(forward) >= k - 1]
+        self.cell_windows = [[] for _ in range(self.size)]
+        for window, cells in enumerate(self.windows):
+            for cell in cells:
+                self.cell_windows[cell].append(window)
+        self.counts = [[0, 0, 0] for _ in self.windows]  # stones per player in each window
+        self.weights = [0] + [4 ** count for count in range(1, k)] + [0]
+        # stones within 2 cells, to generate moves near the action only
+        self.nearby = [0] * self.size
+        self.neighbourhood = [[row * m + col for row in range(max(0, cell // m - 2), min(n, cell // m + 3))
+                               for col in range(max(0, cell % m - 2), min(m, cell % m + 3)) if row * m + col != cell]
+                              for cell in range(self.size)]
+
+    def ray(self, cell, dr, dc):
+        row, col = divmod(cell, self.m)
+        return [(row + dr * step) * self.m + col + dc * step for step in range(1, self.k)
+                if 0 <= row + dr * step < self.n and 0 <= col + dc * step < self.m]
+
+    def __str__(self):
+        return '\n'.join(' '.join(MARKS[cell] for cell in self.cells[row:row + self.m])
+                         for row in range(0, self.size, self.m))
+
+    def window_value(self, counts):
+        if counts[X] and counts[O]:
+            return 0
+        return self.weights[counts[X]] - self.weights[counts[O]]
+
+    def place(self, cell):
+        """ places a stone for the player to move, returns whether it wins (only the lines through cell are checked) """
+        assert not self.winner and self.cells[cell] == EMPTY, 'invalid placement'
+        player, cells = self.player, self.cells
+        cells[cell] = player
+        self.moves.append(cell)
+        self.hash ^= self.zobrist[player][cell] ^ self.side
+        for window in self.cell_windows[cell]:
+            counts = self.counts[window]
+            self.score -= self.window_value(counts)
+            counts[player] += 1
+            self.score += self.window_value(counts)
+        for near in self.neighbourhood[cell]:
+            self.nearby[near] += 1
+
+        if self.completes_line(cell, player, cells):
+            self.winner = player
+        self.player = 3 - player
+        return self.winner == player
+
+    def completes_line(self, cell, player, cells):
+        """ whether player's stone on cell makes k in a row in cells (a board's or a scratch copy) """
+        for forward, backward in self.rays[cell]:
+            line = 1
+            for ray in forward, backward:
+                for other in ray:
+                    if cells[other] != player:
+                        break
+                    line += 1
+            if line >= self.k:
+                return True
+        return False
+
+    def undo(self):
+        """ takes back the last move, returns its cell """
+        cell = self.moves.pop()
+        player = self.cells[cell]
+        self.cells[cell] = EMPTY
+        self.hash ^= self.zobrist[player][cell] ^ self.side
+        for window in self.cell_windows[cell]:
+            counts = self.counts[window]
+            self.score -= self.window_value(counts)
+            counts[player] -= 1
+            self.score += self.window_value(counts)
+        for near in self.neighbourhood[cell]:
+            self.nearby[near] -= 1
+        self.winner = EMPTY
+        self.player = player
+        return cell
+
+    def game_over(self):
+        return bool(self.winner) or len(self.moves) == self.size
+
+    def legal_moves(self):
+        """ empty cells, restricted to those near a stone once the board has any (always all on small boards) """
+        cells = self.cells
+        if not self.moves:
+            return [self.size // 2]
+        if self.size <= 25:
+            return [cell for cell in range(self.size) if not cells[cell]]
+        nearby = self.nearby
+        return [cell for cell in range(self.size) if not cells[cell] and nearby[cell]]
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class AlphaBeta:
+    """
+    negamax alpha-beta with iterative deepening, a Zobrist-keyed transposition table, killer and history move
+    ordering, and a wall-clock budget per move (the deepest completed iteration is played)
+
+    >>> board = MNKBoard(3, 3, 3)
+    >>> while not board.game_over():
+    ...     _ = board.place(AlphaBeta(budget=1.0).choose(board))
+    >>> board.winner  # perfect play draws
+    0
+
+    >>> gomoku = MNKBoard(15, 15, 5)
+    >>> for cell in (0, 112, 14, 113, 210, 114, 224):  # O has three in a row, open on both ends
+    ...     _ = gomoku.place(cell)
+    >>> gomoku.place(111), gomoku.place(AlphaBeta(budget=0.5).choose(gomoku))  # X has to block the four
+    (False, False)
+    >>> gomoku.cells[110] or gomoku.cells[115]
+    1
+    """
+    EXACT, LOWER, UPPER = range(3)
+
+    def __init__(self, budget=1.0, max_depth=64, table_bits=20):
+        self.budget = budget
+        self.max_depth = max_depth
+        self.table = [None] * (1 << table_bits)
+        self.mask = (1 << table_bits) - 1
+        self.killers = [[None, None] for _ in range(max_depth + 1)]
+        self.history = {}
+        self.nodes = self.depth = 0
+        self.deadline = 0.0
+
+    def choose(self, board):
+        """ best move found within the budget """
+        self.nodes, self.deadline = 0, time.perf_counter() + self.budget
+        moves = board.legal_moves()
+        best = moves[0]
+        for depth in range(1, min(self.max_depth, board.size - len(board.moves)) + 1):
+            try:
+                score, move = self.search(board, depth, -WIN - 1, WIN + 1, 0)
+            except SearchTimeout:
+                break
+            best, self.depth = move, depth
+            if abs(score) >= WIN - board.size:  # a forced result was found
+                break
+        return best
+
+    def ordered(self, board, ply, hashed):
+        history, killers = self.history, self.killers[ply]
+        moves = sorted(board.legal_moves(), key=lambda cell: history.get(cell, 0), reverse=True)
+        for first in (killers[1], killers[0], hashed):
+            if first in moves:
+                moves.remove(first)
+                moves.insert(0, first)
+        return moves
+
+    def search(self, board, depth, alpha, beta, ply):
+        """ :return: score for the player to move, best move """
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        if board.winner:  # the previous move won
+            return -(WIN - ply), None
+        if len(board.moves) == board.size:
+            return 0, None
+        if depth == 0:
+            return (board.score if board.player == X else -board.score), None
+
+        entry = self.table[board.hash & self.mask]
+        hashed = None
+        decided = WIN - board.size  # scores beyond are forced results, stored as plies from the entry's position
+        if entry and entry[0] == board.hash:
+            _, entry_depth, score, flag, hashed = entry
+            score = score - ply if score > decided else score + ply if score < -decided else score
+            if entry_depth >= depth and (flag == self.EXACT or (flag == self.LOWER and score >= beta)
+                                         or (flag == self.UPPER and score <= alpha)):
+                return score, hashed
+
+        original, best_score, best_move = alpha, -WIN - 1, None
+        for move in self.ordered(board, ply, hashed):
+            board.place(move)
+            try:
+                score = -self.search(board, depth - 1, -beta, -alpha, ply + 1)[0]
+            finally:
+                board.undo()
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                if self.killers[ply][1] != move:
+                    self.killers[ply] = [self.killers[ply][1], move]
+                self.history[move] = self.history.get(move, 0) + depth * depth
+                break
+
+        flag = self.UPPER if best_score <= original else self.LOWER if best_score >= beta else self.EXACT
+        slot = board.hash & self.mask
+        if not (old := self.table[slot]) or old[0] == board.hash or old[1] <= depth:  # prefer deeper entries
+            stored = (best_score + ply if best_score > decided else best_score - ply if best_score < -decided
+                      else best_score)
+            self.table[slot] = board.hash, depth, stored, flag, best_move
+        return best_score, best_move
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
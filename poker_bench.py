@@ -0,0 +1,172 @@
+"""
+Poker Hands: validation & benchmark
+
+Enumerates all 2.598.960 hands of DECK, checks the counts quoted in the PokerHand.is_* docstrings, and keyer(), the
+is_* predicates and the order of hands against reference_keyer for every hand, then reports hands/sec for
+construction, hand_value, keyer and best_hand.
+
+    python poker_bench.py [--sample N] [--output results.json]
+"""
+import json
+import platform
+import re
+import sys
+import time
+from collections import Counter
+from itertools import combinations
+from random import Random
+
+from poker_hands import (CARD_INT, CATEGORY_VALUE, DECK, HAND_VALUES, RANK_VALUE, STRENGTH_KEY, HandValue, PokerHand, evaluate,
+                         evaluate_many, get_hand_value, parse_cards)
+
+TOTAL = 2_598_960
+PREDICATE = {
+    HandValue.ROYAL_FLUSH: PokerHand.is_royal_flush,
+    HandValue.STRAIGHT_FLUSH: PokerHand.is_straight_flush,
+    HandValue.FOUR_OF_A_KIND: PokerHand.is_four_of_a_kind,
+    HandValue.FULL_HOUSE: PokerHand.is_full_house,
+    HandValue.FLUSH: PokerHand.is_flush,
+    HandValue.STRAIGHT: PokerHand.is_straight,
+    HandValue.THREE_OF_A_KIND: PokerHand.is_three_of_a_kind,
+    HandValue.TWO_PAIR: PokerHand.is_two_pair,
+    HandValue.PAIR: PokerHand.is_pair,
+    HandValue.HIGH_CARD: PokerHand.is_high_card,
+}
+
+
+def documented_counts() -> dict:
+    """
+    Counts quoted as 'Probability: count/2.598.960' in the is_* docstrings.
+    The Straight Flush count includes the Royal Flushes.
+
+    >>> documented_counts()[HandValue.FOUR_OF_A_KIND], documented_counts()[HandValue.STRAIGHT_FLUSH]
+    (624, 36)
+    """
+    counts = {value: int(re.sub(r'\D', '', re.search(r'Probability: ([\d._]+)/', predicate.__doc__)[1]))
+              for value, predicate in PREDICATE.items()}
+    counts[HandValue.STRAIGHT_FLUSH] -= counts[HandValue.ROYAL_FLUSH]
+    return counts
+
+
+def reference_keyer(hand: tuple) -> tuple:
+    """ keyer() computed the slow way, from rank frequencies, as an independent check """
+    ranks = sorted((RANK_VALUE[card[0]] for card in hand), reverse=True)
+    frequency = Counter(ranks)
+    grouped = sorted(frequency, key=lambda rank: (frequency[rank], rank), reverse=True)
+    flush = len({card[1] for card in hand}) == 1
+    straight = len(frequency) == 5 and (ranks[0] - ranks[4] == 4 or ranks == [12, 3, 2, 1, 0])
+    high = ranks[1] if ranks == [12, 3, 2, 1, 0] else ranks[0]
+    shape = sorted(frequency.values(), reverse=True)
+    if straight and flush: return 8, high
+    if shape == [4, 1]: return 7, *grouped
+    if shape == [3, 2]: return 6, *grouped
+    if flush: return 5, *ranks
+    if straight: return 4, high
+    if shape == [3, 1, 1]: return 3, *grouped
+    if shape == [2, 2, 1]: return 2, *grouped
+    if shape == [2, 1, 1, 1]: return 1, *grouped
+    return 0, *ranks
+
+
+def validate() -> dict:
+    """
+    exhaustive: category counts, keyer() and the is_* predicates against reference_keyer for every hand, and the
+    order of strengths (what sorting by keyer() gives) against the order and ties of the reference keys
+    """
+    strengths = Counter(map(evaluate, combinations([CARD_INT[card] for card in DECK], 5)))
+    values = Counter()
+    for strength, count in strengths.items():
+        values[get_hand_value(strength)] += count
+    expected = documented_counts()
+
+    mismatches = predicates = ties = 0
+    reference = {}  # strength -> reference key of its hands
+    for cards in combinations(DECK, 5):
+        hand, key = PokerHand(cards), reference_keyer(cards)
+        mismatches += hand.keyer() != key
+        predicates += not PREDICATE[hand.hand_value()](hand)
+        ties += reference.setdefault(hand.strength, key) != key  # equal strengths, unequal reference keys
+    ordered = [reference[strength] for strength in sorted(reference)]
+    checks = {
+        'total': sum(values.values()) == TOTAL,
+        'counts': all(values[value] == expected[value] for value in HandValue),
+        'classes': len(strengths) == len(STRENGTH_KEY) == 7462,
+        'ordering': ties == 0 and all(key < following for key, following in zip(ordered, ordered[1:])),
+        'categories': all(get_hand_value(strength) is (HandValue.ROYAL_FLUSH if key == (8, 12) else
+                                                       CATEGORY_VALUE[key[0]]) for strength, key in reference.items()),
+        'keyer': mismatches == 0,
+        'predicates': predicates == 0,
+    }
+    return {
+        'counts': {str(value): values[value] for value in reversed(HAND_VALUES)},
+        'expected': {str(value): expected[value] for value in reversed(HAND_VALUES)},
+        'keyer_mismatches': mismatches,
+        'checks': checks,
+        'passed': all(checks.values()),
+    }
+
+
+def benchmark(sample: int = 100_000, seed: int = 0) -> dict:
+    """ hands/sec of each operation over the same random hands, construction with a cold PokerHand.cache """
+    rng = Random(seed)
+    hands = [tuple(rng.sample(DECK, k=5)) for _ in range(sample)]
+    card_ints = [tuple(map(CARD_INT.__getitem__, hand)) for hand in hands]
+    results = {}
+
+    def measure(name: str, function, items) -> list:
+        start = time.perf_counter()
+        output = list(map(function, items))
+        results[name] = round(len(items) / (time.perf_counter() - start))
+        return output
+
+    PokerHand.cache.clear()
+    instances = measure('construction', PokerHand, hands)
+    measure('construction_cached', PokerHand, hands[-PokerHand.cache.maxsize:])
+    measure('evaluate', evaluate, card_ints)
+    measure('hand_value', PokerHand.hand_value, instances)
+    measure('keyer', PokerHand.keyer, instances)
+    measure('best_hand', PokerHand.best_hand, instances)
+    try:
+        array = parse_cards(hands)
+    except ImportError:  # numpy missing
+        pass
+    else:
+        start = time.perf_counter()
+        evaluate_many(array)
+        results['evaluate_many'] = round(len(hands) / (time.perf_counter() - start))
+    return results
+
+
+def main() -> int:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--sample', type=int, default=100_000, help='random hands to time')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    validation = validate()
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'validation': validation,
+        'validation_seconds': round(time.perf_counter() - start, 3),
+        'hands_per_second': benchmark(args.sample, args.seed),
+    }
+    for value, count in validation['counts'].items():
+        print(f'{value:<16} {count:>9,} {"ok" if count == validation["expected"][value] else "MISMATCH"}')
+    for check, passed in validation['checks'].items():
+        print(f'{check:<16} {"ok" if passed else "FAILED"}')
+    for name, rate in results['hands_per_second'].items():
+        print(f'{name:<20} {rate:>12,} hands/sec')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0 if validation['passed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
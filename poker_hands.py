@@ -1,12 +1,18 @@
-from collections import Counter
-from collections.abc import Sequence
+import mmap
+import os
+import sys
+from collections import Counter, OrderedDict, deque, namedtuple
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from functools import cache
+from itertools import combinations
 from random import sample
 
 NAMES = 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten', 'Jack', 'Queen', 'King', 'Ace'
 RANKS = '23456789TJQKA'
 SUITS = 'SDCH'
+PRIMES = 2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41
 
 RANK_VALUE = {rank: value for value, rank in enumerate(RANKS)}
 SUIT_VALUE = {suit: value for value, suit in enumerate(SUITS)}
@@ -23,6 +29,24 @@ def get_card_name(card: str, plural: bool = False) -> str:
     return NAME[card[0]] + 's' * plural
 
 
+def get_card_int(card: str) -> int:
+    """
+    Integer encoding of a card:  xxxbbbbb bbbbbbbb hcdsrrrr xxpppppp
+    b: one bit per rank, hcds: one bit per suit, r: rank value, p: rank prime
+
+    Ordering the integers orders the cards by rank, then suit (like get_card_value).
+
+    >>> f'{get_card_int("KD"):032b}'
+    '00001000000000000010101100100101'
+    """
+    rank, suit = get_card_value(card)
+    return 1 << 16 + rank | 1 << 12 + suit | rank << 8 | PRIMES[rank]
+
+
+CARD_INT = {card: get_card_int(card) for card in DECK}
+CARD_BIT = {card: 1 << index for index, card in enumerate(DECK)}  # a set of cards is a 52-bit mask
+
+
 class HandValue(Enum):
     HIGH_CARD = 'High Card'
     PAIR = 'Pair'
@@ -39,207 +63,471 @@ class HandValue(Enum):
         return self.value
 
 
+def build_tables() -> tuple:
+    """
+    Enumerates the 7462 distinct 5-card hand classes, ordered weakest to strongest.
+    The strength of a hand is the index of its class, its keyer tuple is the sort key.
+
+    :return: flush table and unique-5 table (indexed by the 13-bit rank mask),
+             prime-product table for paired hands, keyer tuple per strength
+    """
+    keys = []  # (keyer tuple, table, index)
+    for combo in combinations(range(12, -1, -1), 5):  # ranks high -> low
+        mask = sum(1 << rank for rank in combo)
+        if combo[0] - combo[4] == 4 or combo == (12, 3, 2, 1, 0):  # Ace plays low in the Wheel
+            high = combo[0] if combo[0] - combo[4] == 4 else combo[1]
+            keys += ((8, high), 'flush', mask), ((4, high), 'unique5', mask)
+        else:
+            keys += ((5, *combo), 'flush', mask), ((0, *combo), 'unique5', mask)
+
+    for first in range(13):
+        others = [rank for rank in range(12, -1, -1) if rank != first]
+        for kicker in others:
+            keys.append(((7, first, kicker), 'product', PRIMES[first] ** 4 * PRIMES[kicker]))
+            keys.append(((6, first, kicker), 'product', PRIMES[first] ** 3 * PRIMES[kicker] ** 2))
+        for kicker1, kicker2 in combinations(others, 2):
+            keys.append(((3, first, kicker1, kicker2), 'product',
+                         PRIMES[first] ** 3 * PRIMES[kicker1] * PRIMES[kicker2]))
+        for kicker1, kicker2, kicker3 in combinations(others, 3):
+            keys.append(((1, first, kicker1, kicker2, kicker3), 'product',
+                         PRIMES[first] ** 2 * PRIMES[kicker1] * PRIMES[kicker2] * PRIMES[kicker3]))
+    for pair1, pair2 in combinations(range(12, -1, -1), 2):
+        for kicker in range(12, -1, -1):
+            if kicker not in (pair1, pair2):
+                keys.append(((2, pair1, pair2, kicker), 'product',
+                             PRIMES[pair1] ** 2 * PRIMES[pair2] ** 2 * PRIMES[kicker]))
+
+    tables = {'flush': [-1] * 8192, 'unique5': [-1] * 8192, 'product': {}}
+    keys.sort()
+    for strength, (_, table, index) in enumerate(keys):
+        tables[table][index] = strength
+    return tables['flush'], tables['unique5'], tables['product'], tuple(key for key, *_ in keys)
+
+
+FLUSH_TABLE, UNIQUE5_TABLE, PRODUCT_TABLE, STRENGTH_KEY = build_tables()
+CATEGORY_VALUE = (HandValue.HIGH_CARD, HandValue.PAIR, HandValue.TWO_PAIR, HandValue.THREE_OF_A_KIND,
+                  HandValue.STRAIGHT, HandValue.FLUSH, HandValue.FULL_HOUSE, HandValue.FOUR_OF_A_KIND,
+                  HandValue.STRAIGHT_FLUSH)
+STRENGTH_VALUE = tuple(CATEGORY_VALUE[key[0]] for key in STRENGTH_KEY[:-1]) + (HandValue.ROYAL_FLUSH,)
+
+
+def evaluate(cards: Sequence[int]) -> int:
+    """
+    Strength of 5 integer encoded cards (see get_card_int), 0 (Seven-High) to 7461 (Royal Flush).
+    Comparing strengths is equivalent to comparing PokerHand.keyer() tuples.
+
+    >>> evaluate([CARD_INT[card] for card in ('AH', 'TH', 'JH', 'QH', 'KH')])
+    7461
+    >>> evaluate([CARD_INT[card] for card in ('7S', '5D', '4C', '3H', '2S')])
+    0
+    """
+    c1, c2, c3, c4, c5 = cards
+    mask = (c1 | c2 | c3 | c4 | c5) >> 16
+    if c1 & c2 & c3 & c4 & c5 & 0xF000:
+        return FLUSH_TABLE[mask]
+    if (strength := UNIQUE5_TABLE[mask]) >= 0:
+        return strength
+    return PRODUCT_TABLE[(c1 & 0xFF) * (c2 & 0xFF) * (c3 & 0xFF) * (c4 & 0xFF) * (c5 & 0xFF)]
+
+
+def get_hand_value(strength: int) -> HandValue:
+    return STRENGTH_VALUE[strength]
+
+
+HAND_VALUES = tuple(HandValue)  # category code -> HandValue
+
+
+@cache
+def get_numpy_tables() -> tuple:
+    """ numpy copies of the lookup tables for the batch evaluator, built on first use """
+    import numpy as np
+
+    products = sorted(PRODUCT_TABLE.items())
+    char_int = np.full(128, -1, dtype=np.int32)  # character code -> rank or suit part of a card integer
+    for rank, value in RANK_VALUE.items():
+        char_int[ord(rank)] = 1 << 16 + value | value << 8 | PRIMES[value]
+    for suit, value in SUIT_VALUE.items():
+        char_int[ord(suit)] = 1 << 12 + value
+    return (np.array(FLUSH_TABLE, dtype=np.int16), np.array(UNIQUE5_TABLE, dtype=np.int16),
+            np.array([product for product, _ in products], dtype=np.int64),
+            np.array([strength for _, strength in products], dtype=np.int16),
+            np.array([HAND_VALUES.index(value) for value in STRENGTH_VALUE], dtype=np.int8),
+            char_int)
+
+
+def parse_cards(cards) -> 'numpy.ndarray':
+    """
+    Converts an array-like of 'AS'-style cards into integer encoded cards (see get_card_int), keeping its shape.
+
+    >>> parse_cards([['AS', 'KD'], ['7C', '2H']]).tolist() == [[CARD_INT['AS'], CARD_INT['KD']],
+    ...                                                       [CARD_INT['7C'], CARD_INT['2H']]]
+    True
+    >>> parse_cards(['AS', 'ASX'])
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid card 'ASX'
+    """
+    import numpy as np
+
+    *_, char_int = get_numpy_tables()
+    chars = np.asarray(cards, dtype=str)
+    if (wrong := np.char.str_len(chars) != 2).any():  # converting to '<U2' would cut longer strings short
+        raise ValueError(f'invalid card {str(chars[wrong][0])!r}')
+    chars = chars.astype('<U2')
+    codes = np.minimum(chars.view(np.uint32).reshape(*chars.shape, 2), 127)
+    ranks, suits = char_int[codes[..., 0]], char_int[codes[..., 1]]
+    invalid = (ranks < 0x10000) | (suits < 0) | (suits >= 0x10000)
+    if invalid.any():
+        raise ValueError(f'invalid card {str(chars[invalid][0])!r}')
+    return ranks | suits
+
+
+def evaluate_many(cards) -> tuple:
+    """
+    Vectorized evaluate() over an (N, 5) array of integer encoded cards (see parse_cards).
+
+    :return: strengths (N,) and category codes (N,), HAND_VALUES[code] is the HandValue
+
+    >>> strengths, codes = evaluate_many(parse_cards([('AH', 'TH', 'JH', 'QH', 'KH'), ('4D', '6S', 'TC', 'JS', 'JC')]))
+    >>> strengths.tolist(), [HAND_VALUES[code] for code in codes]
+    ([7461, 3321], [<HandValue.ROYAL_FLUSH: 'Royal Flush'>, <HandValue.PAIR: 'Pair'>])
+    >>> evaluate_many(parse_cards([('AS', 'AS', 'KD', '7C', '2H')]))
+    Traceback (most recent call last):
+    ...
+    ValueError: hands should consist of 5 distinct cards
+    """
+    import numpy as np
+
+    flush_table, unique5_table, product_keys, product_values, categories, _ = get_numpy_tables()
+    cards = np.asarray(cards, dtype=np.int32)
+    assert cards.ndim == 2 and cards.shape[1] == 5, 'cards should have shape (N, 5)'
+    ordered = np.sort(cards, axis=1)  # card integers are unique per card
+    if (ordered[:, 1:] == ordered[:, :-1]).any():
+        raise ValueError('hands should consist of 5 distinct cards')
+    mask = np.bitwise_or.reduce(cards, axis=1) >> 16
+    flush = (np.bitwise_and.reduce(cards, axis=1) & 0xF000) != 0
+    strengths = np.where(flush, flush_table[mask], unique5_table[mask])
+
+    paired = np.flatnonzero(strengths < 0)
+    if paired.size:
+        products = np.prod(cards[paired] & 0xFF, axis=1, dtype=np.int64)
+        index = np.minimum(np.searchsorted(product_keys, products), product_keys.size - 1)
+        if (product_keys[index] != products).any():
+            raise ValueError('hands should consist of 5 distinct cards')
+        strengths[paired] = product_values[index]
+    return strengths, categories[strengths]
+
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+
+class HandCache:
+    """ bounded LRU cache of interned hands, keyed by card mask """
+    __slots__ = ('hands', 'maxsize', 'hits', 'misses')
+
+    def __init__(self, maxsize: int = 65_536) -> None:
+        self.hands = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+
+    def get(self, mask: int) -> 'PokerHand | None':
+        hand = self.hands.get(mask)
+        if hand is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.hands.move_to_end(mask)
+        return hand
+
+    def put(self, mask: int, hand: 'PokerHand') -> None:
+        self.hands[mask] = hand
+        if len(self.hands) > self.maxsize:
+            self.hands.popitem(last=False)
+
+    def clear(self) -> None:
+        self.hands.clear()
+        self.hits = self.misses = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.hands))
+
+
 class PokerHand:
-    __slots__ = ('hand', 'ranks', 'suits', 'frequency', 'signature')
+    """
+    Hands are immutable and interned: the same 5 cards, in any order, give the same instance
+    (as long as it was not evicted from PokerHand.cache).
+
+    >>> PokerHand(('AS', 'KD', '7C', '7H', '2S')) is PokerHand(('7H', '2S', 'AS', '7C', 'KD'))
+    True
+    >>> import copy, pickle
+    >>> hand = PokerHand(('AS', 'KD', '7C', '7H', '2S'))
+    >>> pickle.loads(pickle.dumps(hand)) is hand, copy.copy(hand) is hand  # interned on the way back too
+    (True, True)
+    >>> PokerHand(('AS', 'KD', 'KD', '7C', '2H'))
+    Traceback (most recent call last):
+    ...
+    ValueError: hand should consist of 5 distinct cards
+    """
+    __slots__ = ('hand', 'cards', 'strength', 'key')
 
-    def __init__(self, hand: Sequence[str]) -> None:
+    cache = HandCache()
+
+    def __new__(cls, hand: Sequence[str]) -> 'PokerHand':
         assert len(hand) == 5, 'hand should consist of 5 cards'
-        self.hand = tuple(sorted(hand, key=get_card_value))
-        self.ranks, self.suits = zip(*self.hand)
-        self.frequency = Counter(self.ranks)
-        self.signature = Counter(self.frequency.values())
+        mask = CARD_BIT[hand[0]] | CARD_BIT[hand[1]] | CARD_BIT[hand[2]] | CARD_BIT[hand[3]] | CARD_BIT[hand[4]]
+        if mask.bit_count() != 5:  # a repeated card would share the mask of other invalid hands
+            raise ValueError('hand should consist of 5 distinct cards')
+        if (self := cls.cache.get(mask)) is None:
+            self = super().__new__(cls)
+            self.hand = tuple(sorted(hand, key=CARD_INT.__getitem__))
+            self.cards = tuple(map(CARD_INT.__getitem__, self.hand))
+            self.strength = evaluate(self.cards)
+            self.key = STRENGTH_KEY[self.strength]
+            cls.cache.put(mask, self)
+        return self
+
+    def __reduce__(self) -> tuple:  # pickle and copy rebuild a hand through __new__, which interns it
+        return self.__class__, (self.hand,)
+
+    @classmethod
+    def cache_info(cls) -> CacheInfo:
+        return cls.cache.info()
 
     @classmethod
     def random(cls, deck: Sequence[str] = DECK) -> 'PokerHand':
         assert len(deck) >= 5, 'deck should have at least 5 cards'
         return cls(sample(deck, k=5))
 
+    @property
+    def ranks(self) -> tuple:
+        return tuple(card[0] for card in self.hand)
+
+    @property
+    def suits(self) -> tuple:
+        return tuple(card[1] for card in self.hand)
+
+    @property
+    def frequency(self) -> Counter:
+        """ count per rank """
+        return Counter(self.ranks)
+
+    @property
+    def signature(self) -> Counter:
+        """ count of ranks per multiplicity, e.g. {2: 1, 3: 1} for a Full House """
+        return Counter(self.frequency.values())
+
     def __repr__(self) -> str:
         return f'{self.__class__.__name__}({list(self.hand)})'
 
     def __str__(self) -> str:
         return ' '.join(self.hand)
 
-    @cache
     def is_royal_flush(self) -> bool:  # an Ace-High Straight Flush
         """
         Sequential Ranks Ten through Ace, Same Suit
         Probability: 4/2.598.960 ~ 0.00015%
         """
-        return self.is_straight_flush() and set(self.ranks) == set('TJQKA')
+        return STRENGTH_VALUE[self.strength] is HandValue.ROYAL_FLUSH
 
-    @cache
     def is_straight_flush(self) -> bool:
         """
         Sequential Ranks, Same Suit
         Probability: 40/2.598.960 ~ 0.0015%
         """
-        return self.is_straight() and self.is_flush()
+        return self.key[0] == 8
 
-    @cache
     def is_four_of_a_kind(self) -> bool:
         """
         One Quadruplet, One kicker
         Probability: 624/2.598.960 ~ 0.024%
         """
-        return self.signature == {1: 1, 4: 1}
+        return self.key[0] == 7
 
-    @cache
     def is_full_house(self) -> bool:
         """
         One Triplet, One Pair
         Probability: 3.744/2.598.960 ~ 0.14%
         """
-        return self.signature == {2: 1, 3: 1}
+        return self.key[0] == 6
 
-    @cache
     def is_flush(self) -> bool:
         """
         Same Suit
         Probability: 5.108/2.598.960 ~ 0.20%
         """
-        return len(set(self.suits)) == 1
+        return self.key[0] in (5, 8)
 
-    @cache
     def is_straight(self) -> bool:
         """
         Sequential Ranks
         Probability: __10__.200/2.598.960 ~ 0.39%
         """
-        return ''.join(self.ranks) in RANKS or self.ranks == ('2', '3', '4', '5', 'A')
+        return self.key[0] in (4, 8)
 
-    @cache
     def is_three_of_a_kind(self) -> bool:
         """
         One Triplet, Two Kickers
         Probability: 54.912/2.598.960 ~ 2.11%
         """
-        return self.signature == {1: 2, 3: 1}
+        return self.key[0] == 3
 
-    @cache
     def is_two_pair(self) -> bool:
         """
         Two Pairs, One Kicker
         Probability: 123.552/2.598.960 ~ 4.75%
         """
-        return self.signature == {1: 1, 2: 2}
+        return self.key[0] == 2
 
-    @cache
     def is_pair(self) -> bool:
         """
         Pair, Three Kickers
         Probability: 1.098.240/2.598.960 ~ 42.26%
         """
-        return self.signature == {1: 3, 2: 1}
+        return self.key[0] == 1
 
-    @cache
     def is_high_card(self) -> bool:
         """
         No Pair
         Probability: 1.302.540/2.598.960 ~ 50.12%
         """
-        return self.signature == {1: 5} and not (self.is_flush() or self.is_straight())
+        return self.key[0] == 0
 
     def hand_value(self) -> HandValue:
-        if self.is_royal_flush():     return HandValue.ROYAL_FLUSH
-        if self.is_straight_flush():  return HandValue.STRAIGHT_FLUSH
-        if self.is_four_of_a_kind():  return HandValue.FOUR_OF_A_KIND
-        if self.is_full_house():      return HandValue.FULL_HOUSE
-        if self.is_flush():           return HandValue.FLUSH
-        if self.is_straight():        return HandValue.STRAIGHT
-        if self.is_three_of_a_kind(): return HandValue.THREE_OF_A_KIND
-        if self.is_two_pair():        return HandValue.TWO_PAIR
-        if self.is_pair():            return HandValue.PAIR
-        return HandValue.HIGH_CARD
+        return STRENGTH_VALUE[self.strength]
 
     def best_hand(self) -> str:
-        match self.hand_value():
+        value = STRENGTH_VALUE[self.strength]
+        _, first, *rest = self.key
+        match value:
             case HandValue.ROYAL_FLUSH:
-                return f'{HandValue.ROYAL_FLUSH!s}'
+                return f'{value!s}'
 
-            case HandValue.STRAIGHT_FLUSH:
-                if self.ranks == ('2', '3', '4', '5', 'A'):
-                    return f'{get_card_name(self.hand[-2])}-High {HandValue.STRAIGHT_FLUSH!s}'
-                return f'{get_card_name(self.hand[-1])}-High {HandValue.STRAIGHT_FLUSH!s}'
+            case HandValue.STRAIGHT_FLUSH | HandValue.FLUSH | HandValue.STRAIGHT:
+                return f'{get_card_name(RANKS[first])}-High {value!s}'
 
-            case HandValue.FOUR_OF_A_KIND:
-                card = next(str(rank) for rank in self.ranks if self.frequency[rank] == 4)
-                return f'{HandValue.FOUR_OF_A_KIND!s}, {get_card_name(card, plural=True)}'
+            case HandValue.FOUR_OF_A_KIND | HandValue.THREE_OF_A_KIND | HandValue.PAIR:
+                return f'{value!s}, {get_card_name(RANKS[first], plural=True)}'
 
             case HandValue.FULL_HOUSE:
-                first = next(str(rank) for rank in self.ranks if self.frequency[rank] == 3)
-                second = next(str(rank) for rank in self.ranks if rank != first)
-                return f'{HandValue.FULL_HOUSE!s}, {get_card_name(first, plural=True)} over {get_card_name(second, plural=True)}'
+                return f'{value!s}, {get_card_name(RANKS[first], plural=True)} over ' \
+                       f'{get_card_name(RANKS[rest[0]], plural=True)}'
+
+            case HandValue.TWO_PAIR:  # low -> high
+                return f'{value!s}, {get_card_name(RANKS[rest[0]], plural=True)} and ' \
+                       f'{get_card_name(RANKS[first], plural=True)}'
+
+            case HandValue.HIGH_CARD:
+                return f'{value!s}, {get_card_name(RANKS[first])}'
 
-            case HandValue.FLUSH:
-                return f'{get_card_name(self.hand[-1])}-High {HandValue.FLUSH!s}'
+        raise AssertionError('unreachable code')
 
-            case HandValue.STRAIGHT:
-                if self.ranks == ('2', '3', '4', '5', 'A'):
-                    return f'{get_card_name(self.hand[-2])}-High {HandValue.STRAIGHT!s}'
-                return f'{get_card_name(self.hand[-1])}-High {HandValue.STRAIGHT!s}'
+    def keyer(self) -> tuple:
+        """
+        ranking (0: High Card .. 8: Straight Flush), followed by the deciding ranks:
+        Straight (Flush): highest card-rank (Five for the Wheel)
+        Four of a Kind / Full House: quadruplet / triplet rank, kicker / pair rank
+        Three of a Kind / Two Pair / Pair: triplet / pair ranks (high -> low), kicker ranks (high -> low)
+        Flush / High Card: ranks (high -> low)
+        """
+        return self.key
 
-            case HandValue.THREE_OF_A_KIND:
-                card = next(str(rank) for rank in self.ranks if self.frequency[rank] == 3)
-                return f'{HandValue.THREE_OF_A_KIND!s}, {get_card_name(card, plural=True)}'
 
-            case HandValue.TWO_PAIR:
-                cards = iter(self.ranks)
-                first = next(str(rank) for rank in cards if self.frequency[rank] == 2)
-                second = next(str(rank) for rank in cards if rank != first and self.frequency[rank] == 2)
-                return f'{HandValue.TWO_PAIR!s}, {get_card_name(first, plural=True)} and {get_card_name(second, plural=True)}'
+def iter_chunks(path: str, chunk_size: int = 1 << 24) -> Iterator[tuple]:
+    """ (start, end, first line number) of chunks of about chunk_size bytes, ending on line boundaries """
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start, size, number = 0, len(data), 1
+            while start < size:
+                end = data.find(b'\n', min(start + chunk_size, size) - 1) + 1 or size
+                yield start, end, number
+                number += data[start:end].count(b'\n')
+                start = end
 
-            case HandValue.PAIR:
-                card = next(str(rank) for rank in self.ranks if self.frequency[rank] == 2)
-                return f'{HandValue.PAIR!s}, {get_card_name(card, plural=True)}'
 
-            case HandValue.HIGH_CARD:
-                return f'{HandValue.HIGH_CARD!s}, {get_card_name(self.hand[-1])}'
+def rank_chunk(path: str, start: int, end: int, number: int = 1, summary: bool = False) -> str | Counter:
+    """
+    Ranks the hands (one per line, e.g. 'AS KD 7C 7H 2S') in a chunk of a file, starting at line number.
+
+    :return: a line per hand with its best hand and strength, or a Counter of HandValues (and 'invalid') if summary,
+        a line that is not a hand gives a line of its line number, 'error' and the reason, or is counted as invalid
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as file:
+    ...     _ = file.write('AS KD 7C 7H 2S\\nAS KD 7C 7H\\n\\nAS KD KD 7C 2H\\n')
+    >>> [line.split('\\t')[:2] for line in rank_chunk(file.name, 0, os.path.getsize(file.name)).splitlines()]
+    [['2S 7C 7H KD AS', 'Pair, Sevens'], ['2', 'error'], ['4', 'error']]
+    >>> rank_chunk(file.name, 0, os.path.getsize(file.name), summary=True)['invalid']
+    2
+    """
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        lines = data[start:end].decode(errors='replace').split('\n')
+    counts = Counter()
+    output = []
+    for number, line in enumerate(lines, number):
+        if not (cards := line.split()):
+            continue
+        try:
+            hand = PokerHand(cards)
+        except (AssertionError, KeyError, ValueError):
+            counts['invalid'] += 1
+            output.append(f'{number}\terror\tinvalid hand {line.strip()!r}\n')
+            continue
+        if summary:
+            counts[hand.hand_value()] += 1
+        else:
+            output.append(f'{hand}\t{hand.best_hand()}\t{hand.strength}\n')
+    return counts if summary else ''.join(output)
+
+
+def rank(path: str, summary: bool = False, workers: int | None = None, chunk_size: int = 1 << 24,
+         out=sys.stdout) -> None:
+    """
+    Streams a hand history file through rank_chunk, chunk by chunk, in order.
+    At most 2 chunks per worker are in flight, so memory does not grow with the file size.
+    Invalid lines are reported (or counted with --summary) without stopping the run.
+    """
+    workers = workers or os.cpu_count() or 1
+    counts = Counter()
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for start, end, number in iter_chunks(path, chunk_size):
+            pending.append(executor.submit(rank_chunk, path, start, end, number, summary))
+            if len(pending) >= 2 * workers:
+                result = pending.popleft().result()
+                counts.update(result) if summary else out.write(result)
+        while pending:
+            result = pending.popleft().result()
+            counts.update(result) if summary else out.write(result)
+    if summary:
+        for value in reversed(HAND_VALUES):
+            out.write(f'{value!s}\t{counts[value]}\n')
+        out.write(f'invalid\t{counts["invalid"]}\n')
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    python -m poker_hands rank FILE [--summary] [--workers N]
+    python -m poker_hands  (runs the doctests)
+    """
+    from argparse import ArgumentParser
 
-        raise AssertionError('unreachable code')
+    parser = ArgumentParser(prog='python -m poker_hands')
+    commands = parser.add_subparsers(dest='command')
+    ranker = commands.add_parser('rank', help='rank a file with one hand per line')
+    ranker.add_argument('file')
+    ranker.add_argument('--summary', action='store_true', help='only print a histogram of hand values')
+    ranker.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    ranker.add_argument('--chunk-size', type=int, default=1 << 24, help='bytes per chunk (default: 16MiB)')
+    args = parser.parse_args(argv)
 
-    def keyer(self) -> tuple:  # TODO: use enum : HandValue w/ match-case-statement
-        ranks = self.ranks[::-1]  # high -> low
-        # 1. Straight Flush
-        if self.is_straight() and self.is_flush():
-            # ranking, highest card-rank
-            return 8, RANK_VALUE[ranks[0]]
-        # 2. Four of a Kind
-        if self.signature == {1: 1, 4: 1}:
-            (quad, _), (kicker, _) = self.frequency.most_common() # TODO: reverse order of kickers
-            # ranking, quadruplet rank, kicker rank
-            return 7, RANK_VALUE[quad], RANK_VALUE[kicker]
-        # 3. Full House
-        if self.signature == {2: 1, 3: 1}:
-            (trip, _), (pair, _) = self.frequency.most_common() # TODO: reverse order of kickers
-            # ranking, triplet rank, pair rank
-            return 6, RANK_VALUE[trip], RANK_VALUE[pair]
-        # 4. Flush
-        if self.is_flush():
-            # ranking, highest card-rank
-            return 5, RANK_VALUE[ranks[0]]
-        # 5. Straight
-        if self.is_straight():
-            # ranking, highest card-rank
-            return 4, RANK_VALUE[ranks[0]]
-        # 6. Three Of A Kind
-        if self.signature == {1: 2, 3: 1}:
-            (trip, _), (kicker1, _), (kicker2, _) = self.frequency.most_common() # TODO: reverse order of kickers
-            # ranking, triplet rank, kicker ranks (high -> low)
-            return 3, RANK_VALUE[trip], RANK_VALUE[kicker1], RANK_VALUE[kicker2]
-        # 7. Two Pair
-        if self.signature == {1: 1, 2: 2}:
-            (pair1, _), (pair2, _), (kicker, _) = self.frequency.most_common() # TODO: reverse order of kickers
-            # ranking, pair ranks (high -> low), kicker rank
-            return 2, RANK_VALUE[pair1], RANK_VALUE[pair2], RANK_VALUE[kicker]
-        # 8. Pair
-        if self.signature == {1: 3, 2: 1}:
-            (pair, _), (kicker1, _), (kicker2, _), (kicker3, _) = self.frequency.most_common() # TODO: reverse order of kickers
-            # ranking, pair rank, kicker ranks (high -> low)
-            return 1, RANK_VALUE[pair], RANK_VALUE[kicker1], RANK_VALUE[kicker3]
-        # 9. High Card
-        # ranking, ranks (high -> low)
-        return 0, *map(RANK_VALUE.get, ranks)
+    if args.command == 'rank':
+        rank(args.file, summary=args.summary, workers=args.workers, chunk_size=args.chunk_size)
+    else:
+        import doctest
+
+        doctest.testmod()
 
 
 def doctest_poker_hand() -> None:
@@ -279,10 +567,16 @@ def doctest_poker_hand() -> None:
     'Five-High Straight Flush'
     >>> PokerHand(('AH', 'TH', 'JH', 'QH', 'KH')).best_hand()
     'Royal Flush'
+
+    >>> PokerHand(('6S', '6D', 'TD', 'TH', 'KH')).keyer()
+    (2, 8, 4, 11)
+    >>> PokerHand(('AS', '2H', '3S', '4H', '5C')).keyer() < PokerHand(('2S', '3H', '4S', '5H', '6C')).keyer()
+    True
+    >>> hands = [PokerHand.random() for _ in range(1000)]
+    >>> sorted(hands, key=PokerHand.keyer) == sorted(hands, key=lambda hand: hand.strength)
+    True
     """
 
 
 if __name__ == '__main__':
-    import doctest
-
-    doctest.testmod()
+    main()
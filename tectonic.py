@@ -1,8 +1,40 @@
 """
 Tectonic
+
+Every region of n cells holds the numbers 1 to n, touching cells (diagonally too) never hold the same number.
+The solver works on a compiled puzzle: flat cells, a group per cell, precomputed peers (touching cells and the rest
+of the group) and a bitmask of candidates per cell (bit v for number v), propagated and searched by fewest
+candidates first.
+
+    python tectonic.py batch FILE [--workers N]  (solution count capped at 2, nodes and time per puzzle)
+    python tectonic.py generate COUNT [--rows 9] [--cols 9] [--difficulty hard] [--seed S]  (unique puzzles)
+    python tectonic.py  (runs the doctests and solves the sample)
+
+A puzzle file holds a puzzle per line: the grid rows as digits (0 for empty), '|', the region rows as letters
+(as grouper reads them), rows separated by spaces, e.g. '300 014 | AAB ACB'. Blank lines and '#' comments are skipped.
 """
-from collections import defaultdict
-from heapq import heappop, heappush, heapify
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+from string import ascii_lowercase, ascii_uppercase, digits
+
+SAMPLE_GRID = [
+    [3, 0, 0, 0, 3, 0, 2, 0, 0],
+    [0, 0, 1, 0, 0, 4, 0, 0, 4],
+    [2, 0, 2, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 1, 0, 1, 0],
+    [0, 5, 0, 0, 0, 2, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 2],
+    [4, 0, 0, 0, 2, 5, 0, 0, 0],
+    [0, 0, 0, 0, 3, 0, 0, 0, 4],
+    [3, 0, 0, 0, 0, 0, 0, 2, 0]
+]
+SAMPLE_REGIONS = 'AABBCCCDD AABBBCCDD AEEFFGHHH EEEFFGGHH IIIIJGGKK LLIJJMMKK LLLJJMMMK NNOOOOPPP NNNOQQPPR'.split()
+NEIGHBOURS = (-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)
+REGION_SYMBOLS = ascii_uppercase + ascii_lowercase + digits  # then from U+0100 on
 
 
 def grouper(grid: list) -> list[list]:
@@ -13,23 +45,61 @@ def grouper(grid: list) -> list[list]:
     return list(res.values())
 
 
+class NodeLimit(Exception):
+    pass
+
+
 class TecTonic:
+    """
+    >>> puzzle = TecTonic([row[:] for row in SAMPLE_GRID], grouper(SAMPLE_REGIONS))
+    >>> puzzle.solve()
+    True
+    >>> print(puzzle)
+    3  5  3  2  3  1  2  3  2
+    1  4  1  4  5  4  5  1  4
+    2  5  2  3  2  3  2  3  5
+    3  1  4  1  4  1  4  1  4
+    4  5  3  2  3  2  5  3  5
+    1  2  1  5  1  4  1  4  2
+    4  5  3  4  2  5  2  3  1
+    1  2  1  5  3  4  1  5  4
+    3  5  4  2  1  2  3  2  1
+    >>> puzzle.nodes  # propagation alone solves it
+    1
+    """
+
     def __init__(self, grid: list[list], groups: list[list]) -> None:
+        if not grid or not grid[0]:
+            raise ValueError('grid should not be empty')
         self.grid = grid
-        self.n = len(grid)
+        self.rows, self.cols = len(grid), len(grid[0])
+        assert all(len(row) == self.cols for row in grid), 'rows should have the same length'
         self.groups = groups
 
+        # compiled form, cell = row * cols + col
+        self.size = self.rows * self.cols
+        self.group_cells = [[row * self.cols + col for row, col in group] for group in groups]
+        self.group_of = [0] * self.size
+        for index, cells in enumerate(self.group_cells):
+            for cell in cells:
+                self.group_of[cell] = index
+        self.neighbours = [[(row + r) * self.cols + col + c for r, c in NEIGHBOURS
+                            if 0 <= row + r < self.rows and 0 <= col + c < self.cols]
+                           for row in range(self.rows) for col in range(self.cols)]
+        self.peers = [sorted(set(self.neighbours[cell]).union(self.group_cells[self.group_of[cell]]) - {cell})
+                      for cell in range(self.size)]
+        self.nodes = 0
+        self.node_limit = float('inf')
+
     def __str__(self) -> str:
         return '\n'.join('  '.join(str(col) if col else ' ' for col in row) for row in self.grid)
 
     def __contains__(self, position: tuple) -> bool:
         row, col = position
-        return 0 <= row < self.n and 0 <= col < self.n
+        return 0 <= row < self.rows and 0 <= col < self.cols
 
     def adjacent(self, row: int, col: int) -> set[int]:
-        return {self.grid[row + r][col + c]
-                for r, c in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
-                if (row + r, col + c) in self}
+        return {self.grid[cell // self.cols][cell % self.cols] for cell in self.neighbours[row * self.cols + col]}
 
     def is_valid(self, value: int, row: int, col: int, group: list) -> bool:
         return ((row, col) in self  # if within bounds
@@ -37,31 +107,344 @@ class TecTonic:
                 and value not in self.adjacent(row, col)  # check adjacent
                 and all(value != self.grid[r][c] for r, c in group))  # check group
 
-    def solve(self) -> None:
-        queue = self.groups
-        heapify(queue)
-        while queue:
-            break
-
-
-print(TecTonic(
-    [
-        [3, 0, 0, 0, 3, 0, 2, 0, 0],
-        [0, 0, 1, 0, 0, 4, 0, 0, 4],
-        [2, 0, 2, 0, 0, 0, 0, 0, 0],
-        [0, 0, 0, 0, 0, 1, 0, 1, 0],
-        [0, 5, 0, 0, 0, 2, 0, 0, 0],
-        [0, 0, 0, 0, 0, 0, 0, 0, 2],
-        [4, 0, 0, 0, 2, 5, 0, 0, 0],
-        [0, 0, 0, 0, 3, 0, 0, 0, 4],
-        [3, 0, 0, 0, 0, 0, 0, 2, 0]
-    ],
-    grouper('AABBCCCDD AABBBCCDD AEEFFGHHH EEEFFGGHH IIIIJGGKK LLIJJMMKK LLLJJMMMK NNOOOOPPP NNNOQQPPR'.split())
-))
-
-print(grouper('AABBCCCDD AABBBCCDD AEEFFGHHH EEEFFGGHH IIIIJGGKK LLIJJMMKK LLLJJMMMK NNOOOOPPP NNNOQQPPR'.split()))
+    def full_domain(self, cell: int) -> int:
+        """ every number of the cell's region """
+        return (1 << len(self.group_cells[self.group_of[cell]]) + 1) - 2
 
-if __name__ == '__main__':
-    import doctest
+    def given_domains(self) -> list[int]:
+        """ candidate bitmask per cell from the grid's givens, before propagation """
+        domains = []
+        for cell in range(self.size):
+            value, full = self.grid[cell // self.cols][cell % self.cols], self.full_domain(cell)
+            assert 0 <= value and 1 << value <= full, f'{value} does not fit a region of {full.bit_length() - 1}'
+            domains.append(1 << value if value else full)
+        return domains
+
+    def domains(self, domains: list[int] | None = None) -> list[int] | None:
+        """ domains (default: given_domains) propagated from their fixed cells, None on a contradiction """
+        domains = self.given_domains() if domains is None else domains[:]
+        fixed = [cell for cell, domain in enumerate(domains) if not domain & (domain - 1)]
+        return domains if self.propagate(domains, fixed) else None
+
+    def propagate(self, domains: list[int], queue: list[int]) -> bool:
+        """
+        in place: fixed cells (queue) remove their number from their peers (neighbour elimination, naked singles),
+        then a number left in a single cell of a group is fixed there (hidden singles), until nothing changes
+        :return: False on a contradiction
+        """
+        peers, groups = self.peers, self.group_cells
+        while True:
+            while queue:
+                cell = queue.pop()
+                bit = domains[cell]
+                for peer in peers[cell]:
+                    if (domain := domains[peer]) & bit:
+                        if not (domain := domain ^ bit):
+                            return False
+                        domains[peer] = domain
+                        if not domain & (domain - 1):
+                            queue.append(peer)
+            for cells in groups:
+                once = twice = 0
+                for cell in cells:
+                    twice |= once & domains[cell]
+                    once |= domains[cell]
+                if once != (1 << len(cells) + 1) - 2:  # a number has no cell left
+                    return False
+                if singles := once & ~twice:
+                    for cell in cells:
+                        domain = domains[cell]
+                        if domain & singles and domain & (domain - 1):
+                            domain &= singles
+                            if domain & (domain - 1):  # two numbers only fit here
+                                return False
+                            domains[cell] = domain
+                            queue.append(cell)
+            if not queue:
+                return True
+
+    def search(self, domains: list[int], limit: int = 1, rng=None):
+        """
+        yields up to limit solutions (as domains), branching on the cell with the fewest candidates,
+        trying its numbers in increasing or (with rng) random order, raises NodeLimit past node_limit nodes
+        """
+        self.nodes += 1
+        if self.nodes > self.node_limit:
+            raise NodeLimit(self.node_limit)
+        open_cells = [cell for cell in range(self.size) if domains[cell] & (domains[cell] - 1)]
+        if not open_cells:
+            yield domains
+            return
+        cell = min(open_cells, key=lambda cell: domains[cell].bit_count())
+        bits = [1 << value for value in range(1, domains[cell].bit_length()) if domains[cell] >> value & 1]
+        if rng:
+            rng.shuffle(bits)
+        for bit in bits:
+            branch = domains[:]
+            branch[cell] = bit
+            if self.propagate(branch, [cell]):
+                for solution in self.search(branch, limit, rng):
+                    yield solution
+                    limit -= 1
+                    if not limit:
+                        return
+
+    def solutions(self, limit: int = 2) -> list[list[list]]:
+        """ up to limit solved grids """
+        self.nodes = 0
+        domains = self.domains()
+        if domains is None:
+            return []
+        return [[[domains[row * self.cols + col].bit_length() - 1 for col in range(self.cols)]
+                 for row in range(self.rows)] for domains in self.search(domains, limit)]
+
+    def solve(self) -> bool:
+        """ fills the grid with a solution, if any """
+        if solutions := self.solutions(1):
+            self.grid[:] = solutions[0]
+        return bool(solutions)
+
+
+def region_symbol(index: int) -> str:
+    return REGION_SYMBOLS[index] if index < len(REGION_SYMBOLS) else chr(0x100 + index)
+
+
+def parse_puzzle(line: str) -> TecTonic:
+    """
+    >>> puzzle = parse_puzzle('0200 0000 0000 | AABB AABB CDDD')  # 3 x 4
+    >>> puzzle.solutions()
+    [[[1, 2, 1, 3], [4, 3, 4, 2], [1, 2, 1, 3]]]
+    >>> len(parse_puzzle('0000 0000 0000 | AABB AABB CDDD').solutions())  # not unique without the given
+    2
+    >>> format_puzzle(puzzle)
+    '0200 0000 0000 | AABB AABB CDDD'
+    """
+    grid, regions = line.split('|')
+    grid = [[int(digit) for digit in row] for row in grid.split()]
+    regions = regions.split()
+    assert [len(row) for row in grid] == [len(row) for row in regions], 'grid and regions should have the same shape'
+    return TecTonic(grid, grouper(regions))
+
+
+def format_puzzle(puzzle: TecTonic) -> str:
+    """ inverse of parse_puzzle """
+    regions = [[''] * puzzle.cols for _ in range(puzzle.rows)]
+    for index, group in enumerate(puzzle.groups):
+        for row, col in group:
+            regions[row][col] = region_symbol(index)
+    return ' '.join(''.join(map(str, row)) for row in puzzle.grid) + ' | ' + ' '.join(map(''.join, regions))
+
+
+def check_lines(lines: list[tuple[int, str]], limit: int = 2) -> list[str]:
+    """
+    a line per puzzle: line number, solutions (up to limit), search nodes, milliseconds, first solution
+
+    >>> [line.split('\\t')[:2] for line in check_lines([(1, '0200 0000 0000 | AABB AABB CDDD'), (2, '|'), (3, '12')])]
+    [['1', '1'], ['2', 'error'], ['3', 'error']]
+    """
+    output = []
+    for number, line in lines:
+        start = time.perf_counter()
+        try:
+            puzzle = parse_puzzle(line)
+            solutions = puzzle.solutions(limit)
+        except (AssertionError, ValueError) as error:
+            output.append(f'{number}\terror\t{error or "invalid puzzle"}\n')
+            continue
+        elapsed = (time.perf_counter() - start) * 1000
+        solved = ' '.join(''.join(map(str, row)) for row in solutions[0]) if solutions else '-'
+        output.append(f'{number}\t{len(solutions)}\t{puzzle.nodes}\t{elapsed:.2f}\t{solved}\n')
+    return output
 
-    doctest.testmod()
+
+def batch(path: str, workers: int | None = None, chunk_size: int = 256, out=sys.stdout) -> None:
+    """
+    Checks a puzzle file through check_lines, chunk_size puzzles per task, in order, with at most 2 tasks per worker
+    in flight. Ends with a summary comment: puzzles with a unique solution, several, none, and puzzles per second.
+    """
+    workers = workers or os.cpu_count() or 1
+    counts, start = {'1': 0, '2': 0, '0': 0, 'error': 0}, time.perf_counter()
+
+    def write(lines):
+        for line in lines:
+            counts[line.split('\t', 2)[1]] += 1
+            out.write(line)
+
+    with open(path) as file, ProcessPoolExecutor(workers) as executor:
+        pending, chunk = deque(), []
+        numbered = ((number, line) for number, line in enumerate(file, 1) if line.strip() and line[0] != '#')
+        for item in numbered:
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                pending.append(executor.submit(check_lines, chunk))
+                chunk = []
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+        if chunk:
+            pending.append(executor.submit(check_lines, chunk))
+        while pending:
+            write(pending.popleft().result())
+    total, elapsed = sum(counts.values()), time.perf_counter() - start
+    out.write(f'# {total} puzzles: {counts["1"]} unique, {counts["2"]} several solutions, {counts["0"]} unsolvable, '
+              f'{counts["error"]} invalid, {total / elapsed:.0f} puzzles/s\n')
+
+
+def random_regions(rows: int, cols: int, rng: Random) -> list[str]:
+    """
+    region rows (as grouper reads them) of a random partition into connected regions of 1 to 5 cells, mostly 5:
+    fillable partitions need few small regions (at most one 1 per 2 x 2 block, so at most a quarter of the cells)
+    """
+    labels, regions = [-1] * (rows * cols), []
+    orthogonal = [[(row + r) * cols + col + c for r, c in ((-1, 0), (0, -1), (0, 1), (1, 0))
+                   if 0 <= row + r < rows and 0 <= col + c < cols] for row in range(rows) for col in range(cols)]
+    for cell in range(rows * cols):  # grown in reading order, towards the earliest free cells, to leave few holes
+        if labels[cell] >= 0:
+            continue
+        region = [cell]
+        labels[cell] = len(regions)
+        regions.append(region)
+        target = rng.choices(range(1, 6), weights=(1, 1, 2, 6, 20))[0]
+        while len(region) < target and (free := sorted({near for member in region for near in orthogonal[member]
+                                                         if labels[near] < 0})):
+            near = rng.choice(free[:2])
+            labels[near] = labels[cell]
+            region.append(near)
+    for index, region in enumerate(regions):  # holes left behind join a neighbouring region if it stays within 5
+        if 0 < len(region) <= 2:
+            merges = {labels[near] for member in region for near in orthogonal[member]} - {index}
+            if merges := [other for other in merges if len(regions[other]) + len(region) <= 5]:
+                other = rng.choice(merges)
+                for member in region:
+                    labels[member] = other
+                regions[other] += region
+                region.clear()
+    symbols = {}
+    return [''.join(region_symbol(symbols.setdefault(label, len(symbols))) for label in labels[row:row + cols])
+            for row in range(0, rows * cols, cols)]
+
+
+def generate(rows: int = 9, cols: int = 9, difficulty: str = 'hard', rng: Random | None = None,
+             fill_limit: int = 100, node_limit: int = 2000) -> TecTonic:
+    """
+    A puzzle with a unique solution: random regions, filled by a randomized search (new regions if it fails
+    within fill_limit nodes), then givens removed in random order while the solution stays unique (a given is kept
+    if checking its removal takes over node_limit nodes).
+    The solver state is kept across removals: per cell, how many given peers rule out each number, and the candidates
+    that leaves. A removal frees its number around that one cell, and only the open cells are propagated from. A
+    removal is checked by searching for a solution differing on that cell only, and a given found necessary is never
+    tried again.
+    :param difficulty: 'easy' keeps every puzzle solvable by propagation alone, 'hard' only needs uniqueness
+
+    >>> puzzle = generate(6, 7, 'easy', Random(0))
+    >>> len(puzzle.solutions()), puzzle.nodes
+    (1, 1)
+    >>> puzzle = generate(6, 7, 'hard', Random(1))
+    >>> len(puzzle.solutions())
+    1
+    """
+    assert difficulty in ('easy', 'hard'), 'difficulty should be easy or hard'
+    rng = rng or Random()
+    while True:
+        puzzle = TecTonic([[0] * cols for _ in range(rows)], grouper(random_regions(rows, cols, rng)))
+        puzzle.node_limit = fill_limit
+        try:
+            if (domains := puzzle.domains()) and (solution := next(puzzle.search(domains, 1, rng), None)):
+                break
+        except NodeLimit:
+            pass
+
+    puzzle.node_limit = node_limit
+    given, peers = [True] * puzzle.size, puzzle.peers
+    ruled_out = [[0] * 6 for _ in range(puzzle.size)]
+    for cell, bit in enumerate(solution):
+        for peer in peers[cell]:
+            ruled_out[peer][bit.bit_length() - 1] += 1
+    base = solution[:]
+
+    def remove(cell):
+        given[cell], value = False, solution[cell].bit_length() - 1
+        base[cell] = puzzle.full_domain(cell) & ~sum(1 << number for number, count in enumerate(ruled_out[cell])
+                                                     if count)
+        for peer in peers[cell]:
+            ruled_out[peer][value] -= 1
+            if not ruled_out[peer][value] and not given[peer]:
+                base[peer] |= 1 << value & puzzle.full_domain(peer)
+
+    def restore(cell):
+        given[cell], base[cell], value = True, solution[cell], solution[cell].bit_length() - 1
+        for peer in peers[cell]:
+            ruled_out[peer][value] += 1
+            if not given[peer]:
+                base[peer] &= ~(1 << value)
+
+    def propagated(domains):
+        """ domains propagated from the open cells they fix, the givens are ruled out of their peers already """
+        fixed = [cell for cell, domain in enumerate(domains) if not domain & (domain - 1) and not given[cell]]
+        return domains if puzzle.propagate(domains, fixed) else None
+
+    order = list(range(puzzle.size))
+    rng.shuffle(order)
+    for cell in order:
+        if puzzle.full_domain(cell) == solution[cell]:  # a region of one cell
+            continue
+        remove(cell)
+        if difficulty == 'easy':
+            unique = (domains := propagated(base[:])) is not None and all(not d & (d - 1) for d in domains)
+        else:
+            other = base[:]
+            other[cell] &= ~solution[cell]
+            puzzle.nodes = 0
+            try:
+                unique = not other[cell] or (domains := propagated(other)) is None or \
+                         next(puzzle.search(domains), None) is None
+            except NodeLimit:
+                unique = False
+        if not unique:
+            restore(cell)
+    givens = [bit if given[cell] else puzzle.full_domain(cell) for cell, bit in enumerate(solution)]
+
+    puzzle.grid = [[0] * cols for _ in range(rows)]
+    for cell, domain in enumerate(givens):
+        if domain != puzzle.full_domain(cell):
+            puzzle.grid[cell // cols][cell % cols] = domain.bit_length() - 1
+    puzzle.node_limit = float('inf')
+    return puzzle
+
+
+def main(argv=None) -> None:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python tectonic.py')
+    commands = parser.add_subparsers(dest='command')
+    checker = commands.add_parser('batch', help='check a file with one puzzle per line')
+    checker.add_argument('file')
+    checker.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    generator = commands.add_parser('generate', help='print puzzles with a unique solution, one per line')
+    generator.add_argument('count', type=int)
+    generator.add_argument('--rows', type=int, default=9)
+    generator.add_argument('--cols', type=int, default=9)
+    generator.add_argument('--difficulty', choices=('easy', 'hard'), default='hard')
+    generator.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        batch(args.file, workers=args.workers)
+    elif args.command == 'generate':
+        rng, start = Random(args.seed), time.perf_counter()
+        for _ in range(args.count):
+            print(format_puzzle(generate(args.rows, args.cols, args.difficulty, rng)), flush=True)
+        print(f'# {args.count / (time.perf_counter() - start) * 60:.0f} puzzles/minute', file=sys.stderr)
+    else:
+        import doctest
+
+        doctest.testmod()
+
+        puzzle = TecTonic([row[:] for row in SAMPLE_GRID], grouper(SAMPLE_REGIONS))
+        print(puzzle, end='\n\n')
+        start = time.perf_counter()
+        puzzle.solve()
+        print(f'{puzzle}\n\n{puzzle.nodes} nodes, {(time.perf_counter() - start) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+TicTacToe bitboards: 9 bits per player, bit i is cell i (0-8, row by row)
+"""
+FULL = 0b111_111_111
+WIN_MASKS = (
+    0b000_000_111, 0b000_111_000, 0b111_000_000,  # rows
+    0b001_001_001, 0b010_010_010, 0b100_100_100,  # columns
+    0b100_010_001, 0b001_010_100,  # diagonals
+)
+MASK_DIRECTION = dict(zip(WIN_MASKS, ('Horizontal',) * 3 + ('Vertical',) * 3 + ('Diagonal',) * 2))
+
+# winning line (or 0) of every possible set of cells, so checking a board is one lookup
+WINNING_LINE = tuple(next((mask for mask in WIN_MASKS if bits & mask == mask), 0) for bits in range(1 << 9))
+
+
+def is_win(bits: int) -> bool:
+    """
+    >>> is_win(0b100_010_001), is_win(0b000_011_001)
+    (True, False)
+    """
+    return WINNING_LINE[bits] != 0
+
+
+def from_cells(cells, mark: str) -> int:
+    """
+    bitboard of the cells holding mark
+
+    >>> bin(from_cells('X_O_X___X', 'X'))
+    '0b100010001'
+    """
+    return sum(1 << index for index, cell in enumerate(cells) if cell == mark)
+
+
+def render(x: int, o: int, empty: str = '_') -> list[list]:
+    """
+    3x3 grid of marks
+
+    >>> render(0b000_000_011, 0b100_000_000)
+    [['X', 'X', '_'], ['_', '_', '_'], ['_', '_', 'O']]
+    """
+    return [['X' if x >> cell & 1 else 'O' if o >> cell & 1 else empty for cell in range(row, row + 3)]
+            for row in range(0, 9, 3)]
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
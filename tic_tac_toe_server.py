@@ -0,0 +1,332 @@
+"""
+TicTacToe server: many concurrent games over TCP, one JSON object per line
+
+    python tic_tac_toe_server.py serve [--port 8765] [--timeout 60]
+    python tic_tac_toe_server.py load [--sessions 1000] [--games 10]  (load generator against a running server)
+
+client -> server:
+    {"op": "join"}                  queue for an opponent
+    {"op": "move", "cell": 1-9}     place a mark (cells numbered as in TicTacToe.play)
+    {"op": "rematch"}               play again once both players asked, scores carry over
+    {"op": "leave"}
+server -> client:
+    {"event": "start", "mark": "X", "round": 1, "scores": [0, 0]}
+    {"event": "move", "mark": "X", "cell": 5, "board": "____X____", "turn": "O" or null once over}
+    {"event": "over", "winner": "X" or null, "scores": [1, 0]}
+    {"event": "left"}, {"event": "evicted"}, {"event": "error", "message": "..."}
+"""
+import asyncio
+import json
+import time
+
+from tic_tac_toe_v2 import TicTacToe
+
+MARKS = 'XO'
+WRITE_LIMIT = 1 << 16  # bytes queued for a client that does not read, before it is dropped
+
+
+class Session:
+    """ a game between two connections, players[0] plays X """
+    __slots__ = 'game', 'players', 'rematch', 'last_active'
+
+    def __init__(self, players, now):
+        self.game = TicTacToe()
+        self.players = players
+        self.rematch = 0  # bit per player who asked for a rematch
+        self.last_active = now
+
+
+class Player:
+    __slots__ = 'writer', 'session', 'index', 'last_active'
+
+    def __init__(self, writer, now):
+        self.writer = writer
+        self.session = None
+        self.index = 0
+        self.last_active = now  # last line received, or the end of its session
+
+    def send(self, message):
+        self.write(encode(message))
+
+    def write(self, line):
+        """ queues line, the handler drains its own writer but not the opponent's: a client falling behind is cut """
+        if not self.writer.is_closing():
+            self.writer.write(line)
+            if self.writer.transport.get_write_buffer_size() > WRITE_LIMIT:
+                self.writer.transport.abort()
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+class Server:
+    """
+    >>> async def demo():
+    ...     server = Server()
+    ...     listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+    ...     port = listener.sockets[0].getsockname()[1]
+    ...     (x_reader, x), (o_reader, o) = [await asyncio.open_connection('127.0.0.1', port) for _ in range(2)]
+    ...     received = lambda reader: reader.readline()
+    ...     for writer, message in ((x, {'op': 'join'}), (o, {'op': 'join'})):
+    ...         writer.write(json.dumps(message).encode() + b'\\n')
+    ...     print((await received(x_reader)).decode(), end='')
+    ...     for writer, cell in ((x, 1), (o, 4), (x, 2), (o, 5), (x, 3)):
+    ...         writer.write(json.dumps({'op': 'move', 'cell': cell}).encode() + b'\\n')
+    ...         await received(x_reader)
+    ...     print((await received(x_reader)).decode(), end='')
+    ...     x.close(); o.close()
+    ...     while server.connections:
+    ...         await asyncio.sleep(0.01)
+    ...     listener.close()
+    >>> asyncio.run(demo())
+    {"event":"start","mark":"X","round":1,"scores":[0,0]}
+    {"event":"over","winner":"X","scores":[1,0]}
+    """
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self.waiting = None  # player waiting for an opponent
+        self.waiting_since = 0.0
+        self.sessions = set()
+        self.players = set()  # every connection
+        self.games = self.moves = self.connections = 0
+
+    async def handle(self, reader, writer):
+        player = Player(writer, time.monotonic())
+        self.players.add(player)
+        self.connections += 1
+        try:
+            while line := await reader.readline():
+                player.last_active = time.monotonic()
+                try:
+                    message = json.loads(line)
+                    self.dispatch(player, message['op'], message)
+                except (ValueError, KeyError, TypeError) as error:
+                    player.send({'event': 'error', 'message': str(error) or type(error).__name__})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.leave(player)
+            writer.close()
+            self.players.discard(player)
+            self.connections -= 1
+
+    def dispatch(self, player, op, message):
+        session = player.session
+        if op == 'join':
+            if session or self.waiting is player:
+                raise ValueError('already joined')
+            if self.waiting is None:
+                self.waiting, self.waiting_since = player, time.monotonic()
+            else:
+                self.start(self.waiting, player)
+        elif op == 'move':
+            if not session or session.game.player != player.index:
+                raise ValueError('not your turn')
+            game = session.game
+            cell = int(message['cell'])
+            game.place(cell)
+            self.moves += 1
+            session.last_active = time.monotonic()
+            board = ''.join(''.join(row) for row in game.grid)
+            turn = None if game.game_over() else MARKS[game.player]
+            self.broadcast(session, {'event': 'move', 'mark': MARKS[player.index], 'cell': cell, 'board': board,
+                                     'turn': turn})
+            if game.game_over():
+                self.games += 1
+                winner = MARKS[game.player] if game.is_won() else None
+                self.broadcast(session, {'event': 'over', 'winner': winner, 'scores': game.scores})
+        elif op == 'rematch':
+            if not session or not session.game.game_over():
+                raise ValueError('game is not over')
+            session.rematch |= 1 << player.index
+            if session.rematch == 3:
+                session.rematch = 0
+                session.game.rematch()
+                session.last_active = time.monotonic()
+                self.announce(session)
+        elif op == 'leave':
+            self.leave(player)
+        else:
+            raise ValueError(f'unknown op {op!r}')
+
+    def start(self, first, second):
+        self.waiting = None
+        session = Session((first, second), time.monotonic())
+        for index, player in enumerate(session.players):
+            player.session, player.index = session, index
+        self.sessions.add(session)
+        self.announce(session)
+
+    def announce(self, session):
+        game = session.game
+        for player in session.players:
+            player.send({'event': 'start', 'mark': MARKS[player.index], 'round': game.round, 'scores': game.scores})
+
+    @staticmethod
+    def broadcast(session, message):
+        line = encode(message)  # encoded once for both players
+        for player in session.players:
+            player.write(line)
+
+    def leave(self, player, event='left'):
+        if self.waiting is player:
+            self.waiting = None
+        if session := player.session:
+            self.sessions.discard(session)
+            for other in session.players:
+                other.session, other.last_active = None, time.monotonic()
+                if other is not player or event == 'evicted':
+                    other.send({'event': event})
+
+    async def evict_idle(self):
+        """
+        ends sessions without a move or rematch for timeout seconds, and closes their connections, as well as the
+        connection of a player waiting that long for an opponent, or outside any game (never joined, or the opponent
+        left) without sending a line for that long
+
+        >>> async def demo():
+        ...     server = Server(timeout=0.1)
+        ...     listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        ...     eviction = asyncio.create_task(server.evict_idle())
+        ...     port = listener.sockets[0].getsockname()[1]
+        ...     reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        ...     writer.write(b'{"op": "join"}\\n')
+        ...     print((await reader.readline()).decode(), end='')
+        ...     print(await reader.readline())  # closed
+        ...     eviction.cancel(); writer.close(); listener.close()
+        >>> asyncio.run(demo())
+        {"event":"evicted"}
+        b''
+        >>> async def silent():
+        ...     server = Server(timeout=0.1)
+        ...     listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        ...     eviction = asyncio.create_task(server.evict_idle())
+        ...     reader, writer = await asyncio.open_connection('127.0.0.1', listener.sockets[0].getsockname()[1])
+        ...     print((await reader.readline()).decode(), end='')  # never joined
+        ...     print(await reader.readline())
+        ...     eviction.cancel(); writer.close(); listener.close()
+        >>> asyncio.run(silent())
+        {"event":"evicted"}
+        b''
+        """
+        while True:
+            await asyncio.sleep(self.timeout / 2)
+            oldest = time.monotonic() - self.timeout
+            if (player := self.waiting) and self.waiting_since < oldest:
+                self.waiting = None
+                player.send({'event': 'evicted'})
+                player.writer.close()
+            for session in [session for session in self.sessions if session.last_active < oldest]:
+                self.leave(session.players[0], 'evicted')
+                for player in session.players:
+                    player.writer.close()
+            for player in [player for player in self.players
+                           if not player.session and player is not self.waiting and player.last_active < oldest]:
+                self.players.discard(player)  # once: handle forgets it as well when the connection is gone
+                player.send({'event': 'evicted'})
+                player.writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        listener = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        async with listener:
+            eviction = asyncio.create_task(self.evict_idle())
+            try:
+                await listener.serve_forever()
+            finally:
+                eviction.cancel()
+
+
+async def load_client(host, port, games, latencies, rng):
+    """ joins, then plays random moves for games rounds, timing each move until the server echoes it """
+    reader, writer = await asyncio.open_connection(host, port)
+    send = lambda message: writer.write(json.dumps(message).encode() + b'\n')
+    mark, sent, played = None, 0.0, 0
+
+    def move(board):
+        nonlocal sent
+        sent = time.perf_counter()
+        send({'op': 'move', 'cell': rng.choice([cell for cell in range(9) if board[cell] == '_']) + 1})
+
+    send({'op': 'join'})
+    while line := await reader.readline():
+        message = json.loads(line)
+        event = message['event']
+        if event == 'start':
+            mark = message['mark']
+            if mark == 'X':
+                move('_' * 9)
+        elif event == 'move':
+            if message['mark'] == mark:
+                latencies.append(time.perf_counter() - sent)
+            elif message['turn'] == mark:
+                move(message['board'])
+        elif event == 'over':
+            played += 1
+            if played == games:
+                break
+            send({'op': 'rematch'})
+        elif event in ('left', 'evicted', 'error'):
+            break
+        await writer.drain()
+    writer.close()
+
+
+async def load(host='127.0.0.1', port=8765, sessions=1000, games=10, seed=None):
+    """ :return: report of moves/sec and move latency percentiles over 2 * sessions concurrent clients """
+    from random import Random
+
+    rng, latencies = Random(seed), []
+    start = time.perf_counter()
+    await asyncio.gather(*(load_client(host, port, games, latencies, rng) for _ in range(2 * sessions)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    percentile = lambda share: latencies[min(len(latencies) - 1, int(share * len(latencies)))] * 1000
+    return {'sessions': sessions, 'moves': len(latencies), 'seconds': round(elapsed, 2),
+            'moves_per_sec': round(len(latencies) / elapsed), 'p50_ms': round(percentile(0.5), 2),
+            'p99_ms': round(percentile(0.99), 2)}
+
+
+def raise_file_limit():
+    """ every session holds two sockets, allow as many as the hard limit """
+    try:
+        import resource
+
+        _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def main(argv=None):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python tic_tac_toe_server.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('serve', help='host games').add_argument(
+        '--timeout', type=float, default=60.0, help='seconds before an idle session is evicted (default: 60)')
+    generator = commands.add_parser('load', help='measure a running server')
+    generator.add_argument('--sessions', type=int, default=1000, help='concurrent games (default: 1000)')
+    generator.add_argument('--games', type=int, default=10, help='rounds per session (default: 10)')
+    args = parser.parse_args(argv)
+
+    raise_file_limit()
+    if args.command == 'serve':
+        try:
+            asyncio.run(Server(args.timeout).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'load':
+        print(json.dumps(asyncio.run(load(args.host, args.port, args.sessions, args.games))))
+    else:
+        import doctest
+
+        doctest.testmod()
+
+
+if __name__ == '__main__':
+    main()
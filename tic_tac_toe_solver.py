@@ -0,0 +1,117 @@
+"""
+TicTacToe perfect play: every reachable position solved once, stored per symmetry class
+"""
+import os
+from array import array
+from functools import cache
+
+from tic_tac_toe_bitboard import FULL, WINNING_LINE
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tic_tac_toe.bin')
+TABLE_MAGIC = b'TTT1'
+
+# the 8 symmetries of the board as cell permutations: rotations and reflections
+SYMMETRIES = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8), (6, 3, 0, 7, 4, 1, 8, 5, 2), (8, 7, 6, 5, 4, 3, 2, 1, 0), (2, 5, 8, 1, 4, 7, 0, 3, 6),
+    (2, 1, 0, 5, 4, 3, 8, 7, 6), (0, 3, 6, 1, 4, 7, 2, 5, 8), (6, 7, 8, 3, 4, 5, 0, 1, 2), (8, 5, 2, 7, 4, 1, 6, 3, 0),
+)
+# every bitboard under every symmetry, so transforming a position is two lookups
+TRANSFORMS = tuple(tuple(sum(1 << symmetry[cell] for cell in range(9) if bits >> cell & 1) for bits in range(1 << 9))
+                   for symmetry in SYMMETRIES)
+
+
+def canonical(x: int, o: int) -> int:
+    """
+    key of a position's symmetry class: the smallest (x << 9 | o) over the 8 symmetries
+
+    >>> canonical(0b000_000_001, 0) == canonical(0b100_000_000, 0) == canonical(0b000_000_100, 0)
+    True
+    """
+    return min(transform[x] << 9 | transform[o] for transform in TRANSFORMS)
+
+
+def solve() -> dict:
+    """
+    negamax over all reachable positions, with a transposition table keyed by canonical
+    :return: {canonical key: score for the player to move}, the score is positive for a win, negative for a loss,
+             0 for a draw, its magnitude is 1 + the empty cells left when the game ends (quicker wins score higher)
+    """
+    table = {}
+
+    def search(mover: int, other: int) -> int:  # bitboards of the player to move and of the other player
+        x, o = (mover, other) if (mover | other).bit_count() % 2 == 0 else (other, mover)
+        key = canonical(x, o)
+        if key not in table:
+            empty = FULL & ~(mover | other)
+            if WINNING_LINE[other]:
+                table[key] = -1 - empty.bit_count()
+            elif not empty:
+                table[key] = 0
+            else:
+                table[key] = max(-search(other, mover | 1 << cell) for cell in range(9) if empty >> cell & 1)
+        return table[key]
+
+    search(0, 0)
+    return table
+
+
+def save_table(table: dict, path: str = TABLE_PATH) -> None:
+    """ magic, then the keys (uint32) and the scores (int8) in key order """
+    keys = sorted(table)
+    with open(path, 'wb') as file:
+        file.write(TABLE_MAGIC)
+        array('I', [len(keys)]).tofile(file)
+        array('I', keys).tofile(file)
+        array('b', [table[key] for key in keys]).tofile(file)
+
+
+def load_table(path: str = TABLE_PATH) -> dict:
+    with open(path, 'rb') as file:
+        if file.read(4) != TABLE_MAGIC:
+            raise ValueError(f'{path!r} is not a TicTacToe table')
+        size, keys, scores = array('I'), array('I'), array('b')
+        size.fromfile(file, 1)
+        keys.fromfile(file, size[0])
+        scores.fromfile(file, size[0])
+    return dict(zip(keys, scores))
+
+
+@cache
+def get_table(path: str = TABLE_PATH) -> dict:
+    """ loads the solved table, solving and saving it first if missing """
+    try:
+        return load_table(path)
+    except (OSError, EOFError, ValueError):
+        table = solve()
+        save_table(table, path)
+        return table
+
+
+def score(x: int, o: int) -> int:
+    """ score of a position for the player to move (see solve) """
+    return get_table()[canonical(x, o)]
+
+
+def best_moves(x: int, o: int) -> list[int]:
+    """
+    cells (0-8) of the moves keeping the best score for the player to move, one table lookup per empty cell
+
+    >>> len(get_table())
+    765
+    >>> best_moves(0b000_000_011, 0b000_011_000)  # X to complete the top row
+    [2]
+    >>> best_moves(0b000_000_011, 0b000_001_000)  # O has to block
+    [2]
+    """
+    x_to_move = (x | o).bit_count() % 2 == 0
+    empty = FULL & ~(x | o)
+    scores = {cell: -score(x | 1 << cell, o) if x_to_move else -score(x, o | 1 << cell)
+              for cell in range(9) if empty >> cell & 1}
+    best = max(scores.values())
+    return [cell for cell, value in scores.items() if value == best]
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
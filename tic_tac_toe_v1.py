@@ -1,4 +1,4 @@
-import re
+from tic_tac_toe_bitboard import MASK_DIRECTION, WINNING_LINE, from_cells
 
 
 # ------------------------------------------------------ start ------------------------------------------------------ #
@@ -72,22 +72,16 @@ def format_list(input_list):
 
 
 def is_finished(board, symbol):
-    board = "".join(board).replace(symbol, "#")
-    finished = True
-    # regular expressions
-    if re.match("^###......$", board) or re.match("^...###...$", board) or re.match("^......###$", board):
-        print("[Horizontal match for '" + symbol + "']")
-    elif re.match("^#..#..#..$", board) or re.match("^.#..#..#.$", board) or re.match("^..#..#..S$", board):
-        print("[Vertical match for '" + symbol + "']")
-    elif re.match("^#...#...S$", board) or re.match("^..#.#.#..$", board):
-        print("[Diagonal match for '" + symbol + "']")
+    line = WINNING_LINE[from_cells(board, symbol)]
+    if line:
+        print("[" + MASK_DIRECTION[line] + " match for '" + symbol + "']")
     else:
         print("[No matches for '" + symbol + "']")
-        finished = False
-    return finished
+    return line != 0
 
 
-tic_tac_toe()
+if __name__ == "__main__":
+    tic_tac_toe()
 
 
 # ------------------------------------------------------- end ------------------------------------------------------- #
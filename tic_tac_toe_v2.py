@@ -1,6 +1,11 @@
+from random import choice
+
+from tic_tac_toe_bitboard import WINNING_LINE, render
+
+
 # noinspection PyAttributeOutsideInit
 class TicTacToe:
-    has_3 = staticmethod(lambda S: bool({'XXX', 'OOO'} & S))
+    __slots__ = 'scores', 'round', 'player', 'turn', '_is_won', 'boards'
 
     def __init__(self):
         self.scores = [0, 0]
@@ -10,18 +15,24 @@ class TicTacToe:
     def __str__(self):
         return '\n'.join(map(' '.join, self.grid))
 
+    @property
+    def grid(self):
+        return render(*self.boards)
+
     @property
     def mark(self):
         return 'O' if self.player else 'X'
 
     def place(self, placement):
-        assert not self.game_over(), 'game is over'
+        if self.game_over():
+            raise ValueError('game is over')
         placement -= 1
-        r, c = divmod(placement, 3)
-        assert 0 <= placement < 9 and self.grid[r][c] == '_', 'invalid placement'
+        if not (0 <= placement < 9 and not (self.boards[0] | self.boards[1]) >> placement & 1):
+            raise ValueError('invalid placement')
 
-        self.grid[r][c] = self.mark
-        if self.is_won():
+        self.boards[self.player] |= 1 << placement
+        if WINNING_LINE[self.boards[self.player]]:
+            self._is_won = True
             self.scores[self.player] += 1
         else:
             self.turn += 1
@@ -30,38 +41,45 @@ class TicTacToe:
     def reset(self):
         self.player = self.turn = 0
         self._is_won = False
-        self.grid = [['_', '_', '_'], ['_', '_', '_'], ['_', '_', '_']]
+        self.boards = [0, 0]  # bitboards of X and O
 
     def is_won(self):
-        if not self._is_won and self.turn < 9:
-            self._is_won = (
-                    self.has_3(set(map(''.join, self.grid))) or
-                    self.has_3(set(map(''.join, zip(*self.grid)))) or
-                    self.has_3(set(map(''.join, (
-                        (self.grid[i][i] for i in range(3)), (self.grid[2 - i][i] for i in range(3))))))
-            )
         return self._is_won
 
     def game_over(self):
-        return self.is_won() or self.turn == 9
+        return self._is_won or self.turn == 9
 
     def rematch(self):
-        assert self.game_over()
+        if not self.game_over():
+            raise ValueError('game is not over')
         self.round += 1
         self.reset()
 
-    def play(self):
+    def ai_move(self):
+        """ a perfect move for the player to move, looked up in the solved table """
+        from tic_tac_toe_solver import best_moves
+
+        return choice(best_moves(*self.boards)) + 1
+
+    def play(self, ai=None):
+        """ :param ai: mark ('X' or 'O') played by the computer, None for two players """
         print('The board is numbered with the nine positions as follows\n1 2 3\n4 5 6\n7 8 9')
         while 1:
             print(f'\nROUND {self.round}:\n{self}')
 
             while not self.game_over():
+                if self.mark == ai:
+                    placement = self.ai_move()
+                    print(f'\n{self.mark} places at {placement}')
+                    self.place(placement)
+                    print(self)
+                    continue
                 inp = input(f'\n{self.mark}\'s turn\n[1-9]? ')
                 if inp.lower() == 'stop': return 1
                 try:
                     self.place(int(inp))
                     print(self)
-                except (AssertionError, ValueError):
+                except ValueError:
                     print(f'Unable to place at "{inp}". Try again.')
 
             print('\n{} Won\nStandings: X: {} - O: {}\n'.format(self.mark, *self.scores))
@@ -71,4 +89,7 @@ class TicTacToe:
             self.rematch()
 
 
-TicTacToe().play()
+if __name__ == '__main__':
+    import sys
+
+    TicTacToe().play(ai=sys.argv[1].upper() if len(sys.argv) > 1 else None)  # e.g. python tic_tac_toe_v2.py O